@@ -1,10 +1,7 @@
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.naive_bayes import MultinomialNB
 from typer import Argument
-from ai.utils import (
-    detect_language,
-    remove_punctuation_and_whitespace
-)
+from ai.utils import counter
 from ai import config
 
 class ArgumentClassifier:
@@ -27,18 +24,26 @@ class ArgumentClassifier:
         x_transformed = self.__cv.transform(x)
         return self.__clf.score(x_transformed, y)
 
+    # Keep only the arguments & fields, which training and suggesting argument types read.
+    @staticmethod
+    def samples(discussions):
+        return [
+            {field: discussion[field] for field in ['id', 'Position', 'DiscussionText', 'CleanText', 'Language']}
+            for discussion in discussions
+            if discussion['Position'] not in ['Issue', 'Solution']
+        ]
+
     # Suggest different argument types based on documents.
     @staticmethod
-    def suggest_argument_types(discussions, lang_det):
+    @counter
+    def suggest_argument_types(discussions):
         res = []
         for discussion in discussions:
 
             if discussion['Position'] in ['Issue', 'Solution']:
                 continue
 
-            text = discussion['DiscussionText']
-            language = detect_language(lang_det, text)
-            text = remove_punctuation_and_whitespace(text)
+            text, language = discussion['CleanText'], discussion['Language']
 
             if language == 'english':
                 predicted = ArgumentClassifier.english_classifier.predict([text])[0]
@@ -58,7 +63,8 @@ class ArgumentClassifier:
         }
 
     @staticmethod
-    def train_classifiers(discussions, lang_det):
+    @counter
+    def train_classifiers(discussions):
         english_classifier = ArgumentClassifier()
         greek_classifier = ArgumentClassifier()
 
@@ -69,9 +75,7 @@ class ArgumentClassifier:
             if discussion['Position'] in ['Issue', 'Solution']:
                 continue
 
-            text = discussion['DiscussionText']
-            language = detect_language(lang_det, text)
-            text = remove_punctuation_and_whitespace(text)
+            text, language = discussion['CleanText'], discussion['Language']
             if language == 'english':
                 english_texts.append(text)
                 english_labels.append(discussion['Position'])
@@ -1,12 +1,9 @@
 import numpy as np
 from sklearn.decomposition import PCA
 from sklearn_extra.cluster import KMedoids
-from ai.utils import (
-    detect_language,
-    remove_punctuation_and_whitespace
-)
+from ai.utils import counter
 from ai.summarization import (
-    run_textrank, text_summarization
+    summarize_batch
 )
 from ai import config
 from yellowbrick.cluster import KElbowVisualizer
@@ -45,7 +42,8 @@ class ArgumentClusterer:
 
     # Sort different arguments into similar clusters.
     @staticmethod
-    def suggest_clusters(discussions, lang_det, en_nlp, el_nlp):
+    @counter
+    def suggest_clusters(discussions, en_textrank, el_textrank):
 
         # If the workspace does not have enough discussions, early exit.
         if len(discussions) < 3:
@@ -55,7 +53,7 @@ class ArgumentClusterer:
             }
         
         # Fit all clusterers for all discussions of a single workspace.
-        ArgumentClusterer.fit_clusterers(discussions, lang_det, en_nlp, el_nlp)
+        ArgumentClusterer.fit_clusterers(discussions)
         english_clusters = {
             label: {'nodes': [], 'texts': [], 'summary': '', 'medoid_text': ''} 
             for label in map(str, ArgumentClusterer.english_clusterer.__clusterer.labels_)
@@ -70,39 +68,36 @@ class ArgumentClusterer:
             if discussion['Position'] in ['Issue', 'Solution']:
                 continue
 
-            text = discussion['DiscussionText']
-            language = detect_language(lang_det, text)
-            text = remove_punctuation_and_whitespace(text)
+            text, language = discussion['CleanText'], discussion['Language']
 
             if language == 'english':
                 if ArgumentClusterer.english_clusterer is None:
                     continue
-                predicted = str(ArgumentClusterer.english_clusterer.predict([en_nlp.tokenizer(text).vector])[0])
+                predicted = str(ArgumentClusterer.english_clusterer.predict([discussion['Vector']])[0])
                 english_clusters[predicted]['nodes'].append(discussion['id'])
                 english_clusters[predicted]['texts'].append(text)
                 english_clusters[predicted]['medoid_text'] = ArgumentClusterer.english_clusterer.__medoid_texts[predicted]
             elif language == 'greek':
                 if ArgumentClusterer.greek_clusterer is None:
                     continue
-                predicted = str(ArgumentClusterer.greek_clusterer.predict([el_nlp.tokenizer(text).vector])[0])
+                predicted = str(ArgumentClusterer.greek_clusterer.predict([discussion['Vector']])[0])
                 greek_clusters[predicted]['nodes'].append(discussion['id'])
                 greek_clusters[predicted]['texts'].append(text)
                 greek_clusters[predicted]['medoid_text'] = ArgumentClusterer.greek_clusterer.__medoid_texts[predicted]
 
-        # Run textrank on non-empty aggregated text from each cluster for each language.
-        for en_cluster in english_clusters.keys():
-            en_text = '. '.join(english_clusters[en_cluster]['texts'])
-            if en_text != '':
-                en_doc = run_textrank(en_text, en_nlp)
-                english_clusters[en_cluster]['summary'] = text_summarization(en_doc, en_nlp, config.top_n, config.top_sent)
-            del english_clusters[en_cluster]['texts']
-
-        for el_cluster in greek_clusters.keys():
-            el_text = '. '.join(greek_clusters[el_cluster]['texts'])
-            if el_text != '':
-                el_doc = run_textrank(el_text, el_nlp)
-                greek_clusters[el_cluster]['summary'] = text_summarization(el_doc, el_nlp, config.top_n, config.top_sent)
-            del greek_clusters[el_cluster]['texts']
+        # Summarize the non-empty aggregated text of all clusters of both languages at once.
+        jobs = [
+            ((language, cluster), '. '.join(clusters[cluster].pop('texts')), language)
+            for language, clusters in [('english', english_clusters), ('greek', greek_clusters)]
+            for cluster in clusters.keys()
+        ]
+        summaries = summarize_batch(
+            [job for job in jobs if job[1] != ''], en_textrank, el_textrank,
+            config.textrank_n_process, config.textrank_batch_size
+        )
+        for (language, cluster), summary in summaries.items():
+            clusters = english_clusters if language == 'english' else greek_clusters
+            clusters[cluster]['summary'] = summary
 
         return {
             'greek_clusters': greek_clusters,
@@ -110,28 +105,26 @@ class ArgumentClusterer:
         }
 
     @staticmethod
-    def fit_clusterers(discussions, lang_det, en_nlp, el_nlp):
+    def fit_clusterers(discussions):
         english_clusterer, greek_clusterer = None, None
         english_texts, greek_texts = [], []
+        english_embeddings, greek_embeddings = [], []
 
         for discussion in discussions:
             if discussion['Position'] in ['Issue', 'Solution']:
                 continue
-            text = discussion['DiscussionText']
-            language = detect_language(lang_det, text)
-            text = remove_punctuation_and_whitespace(text)
+            text, language = discussion['CleanText'], discussion['Language']
             if language == 'english':
                 english_texts.append(text)
+                english_embeddings.append(discussion['Vector'])
             elif language == 'greek':
                 greek_texts.append(text)
+                greek_embeddings.append(discussion['Vector'])
 
         if len(english_texts) > 2:
             # Initialize the English Clusterer.
             english_clusterer = ArgumentClusterer()
 
-            # Calculate the embeddings for each text of this discussion.
-            english_embeddings = [en_nlp.tokenizer(text).vector for text in english_texts]
-
             # Fit the clusterer using the textual embeddings of this discussion.
             english_clusterer.fit(english_embeddings, 'english.pdf')
 
@@ -145,9 +138,6 @@ class ArgumentClusterer:
             # Initialize the Greek Clusterer.
             greek_clusterer = ArgumentClusterer()
 
-            # Calculate the embeddings for each text of this discussion.
-            greek_embeddings = [el_nlp.tokenizer(text).vector for text in greek_texts]
-
             # Fit the clusterer using the textual embeddings of this discussion.
             greek_clusterer.fit(greek_embeddings, 'greek.pdf')
 
@@ -20,12 +20,66 @@ neo4j_pwd = config('NEO4J_INITDB_ROOT_PASSWORD')
 bolt_port = config('NEO4J_BOLT_PORT', cast = int)
 neo4j_url = config('NEO4J_URL')
 neo4j_connection_string = f'bolt://{neo4j_url}:{bolt_port}'
+neo4j_max_connection_pool_size = config('NEO4J_MAX_CONNECTION_POOL_SIZE', default = 50, cast = int)
+neo4j_connection_acquisition_timeout = 60 # secs
+neo4j_max_transaction_retry_time = 30 # secs
+gds_max_memory_bytes = config('GDS_MAX_MEMORY_BYTES', default = 1024**3, cast = int)
 
 mongo_user = config('MONGO_INITDB_ROOT_USERNAME')
 mongo_pwd = config('MONGO_INITDB_ROOT_PASSWORD')
 mongo_port = config('MONGO_LOCALHOST_PORT')
 mongo_url = config('MONGO_URL')
 mongo_connection_string = f'mongodb://{mongo_user}:{mongo_pwd}@{mongo_url}:{mongo_port}'
+mongo_max_pool_size = config('MONGO_MAX_POOL_SIZE', default = 100, cast = int)
+mongo_min_pool_size = config('MONGO_MIN_POOL_SIZE', default = 5, cast = int)
+
+# The API caches the analysis responses, until the scheduler writes a new analysis.
+analysis_cache_size = config('ANALYSIS_CACHE_SIZE', default = 1024, cast = int)
+analysis_cache_ttl = config('ANALYSIS_CACHE_TTL', default = 300, cast = int) # secs
+
+
+# Persistent embedding cache, shared across scheduler runs.
+embedding_cache_dir = config('EMBEDDING_CACHE_DIR', default = '/downloads/embedding_cache')
+embedding_cache_dim = 300
+embedding_cache_capacity = config('EMBEDDING_CACHE_CAPACITY', default = 100000, cast = int)
+
+# Memory-mapped spaCy vector tables, shared read-only by all processes.
+shared_vectors = config('ML_SHARED_VECTORS', default = True, cast = bool)
+shared_vectors_dir = config('SHARED_VECTORS_DIR', default = '/downloads/shared_vectors')
+
+
+# Only reanalyze the workspaces whose discussions changed since the last run.
+incremental_analysis = config('ML_INCREMENTAL_ANALYSIS', default = True, cast = bool)
+
+# The backend of the similarity graph & communities: 'neo4j' (GDS) or 'memory' (in-process).
+graph_backend = config('ML_GRAPH_BACKEND', default = 'neo4j')
+
+# Number of processes which analyze workspaces in parallel (1 runs them in-process).
+pipeline_workers = config('ML_PIPELINE_WORKERS', default = 1, cast = int)
+
+# Ingestion from the Ergologic backend: each request has a timeout (secs) & retries.
+# The page size, the workspace & the date filters are only used if the upstream supports them.
+ergologic_timeout = config('ERGOLOGIC_TIMEOUT', default = 30, cast = int)
+ergologic_retries = 3
+ergologic_fetch_workers = 4
+ergologic_page_size = config('ERGOLOGIC_PAGE_SIZE', default = 0, cast = int) # 0: no pagination.
+ergologic_limit_param = 'limit'
+ergologic_offset_param = 'offset'
+ergologic_max_pages = 10000 # Pages per endpoint, in case the upstream keeps returning full pages.
+ergologic_space_param = config('ERGOLOGIC_SPACE_PARAM', default = '')
+ergologic_since_param = config('ERGOLOGIC_SINCE_PARAM', default = '')
+
+# Maximum time the scheduler waits for Neo4j & MongoDB to accept queries on startup.
+services_ready_timeout = config('SERVICES_READY_TIMEOUT', default = 300, cast = int) # secs
+services_ready_max_delay = 10 # secs, between two readiness probes.
+
+# The ML Pipeline runs on the cron schedule, if given, otherwise at a fixed rate.
+scheduler_interval_secs = config('SCHEDULER_INTERVAL_SECS', default = 60 * 60, cast = int)
+scheduler_cron = config('SCHEDULER_CRON', default = '')
+pipeline_lock_lease_secs = 600 # Renewed while the pipeline runs.
+trigger_poll_interval_secs = 10 # Only without MongoDB change streams.
+# The shared secret of the X-Trigger-Key header of POST /trigger-analysis (empty: the endpoint is disabled).
+trigger_api_key = config('TRIGGER_API_KEY', default = '')
 
 
 # Supported data types
@@ -41,8 +95,17 @@ position_number_to_string = {
 
 
 # Algorithmic values
+neo4j_delete_batch_size = 10000
+neo4j_write_batch_size = 5000
 cutoff = 0.5
+similarity_block_size = 1024
+ann_threshold = 5000 # Texts per language above which the LSH index is used.
+ann_max_degree = 10
 top_n = 10
+language_memo_size = 100000
+html_memo_size = 100000
 top_sent = 5
+textrank_n_process = 1 # Processes of nlp.pipe, when summarizing communities.
+textrank_batch_size = 16
 en_stopword_prefixes = ['and ', 'or ']
 el_stopword_prefixes = ['και ', 'ή ']
@@ -22,71 +22,119 @@ def extract_node_groups(discussions, node_types, fields):
     return node_groups
 
 
-def create_discussion_nodes(database, node_groups):
+def create_constraints(database):
     """
-    Function that creates each node in the database.
+    Function that creates the unique id constraint and the SpaceId index
+    of the discussion nodes, once for all workspaces.
     """
-    # Create a unique constraint and merge all nodes of each node group.
-    for label, nodes in node_groups.items():
-        try:
-            query = (
-                f'CREATE CONSTRAINT ON (node:Node) '
-                'ASSERT node.id IS UNIQUE'
-            )
-            database.execute(query, 'w')
-        except:
-            pass
-        if nodes: # Create (or Merge) nodes, if the collection is not empty.
-            # Construct the neo4j list of dictionaries string.
-            string_builder, single_quote = '[', '\''
-            for node in nodes:
-                item = ', '.join(f'{k}: {v if type(v) == int else single_quote+v+single_quote}' for k, v in node.items())
-                string_builder += f'{{{item}}}, '
-            list_of_dicts = string_builder[:-2] + ']'
+    database.execute(
+        'CREATE CONSTRAINT node_id IF NOT EXISTS ON (node:Node) '
+        'ASSERT node.id IS UNIQUE', 'w'
+    )
+    database.execute(
+        'CREATE INDEX node_space_id IF NOT EXISTS FOR (node:Node) '
+        'ON (node.SpaceId)', 'w'
+    )
+    return
 
-            query = (
-                f'UNWIND {list_of_dicts} AS node '
-                f'MERGE (n:Node {{UserId: node.UserId, id: node.id, '
-                f'SpaceId: node.SpaceId, Position: node.Position, '
-                f'DiscussionText: node.DiscussionText}})'
-            )
-            database.execute(query, 'w')
+
+def delete_in_batches(database, match, batch_size = 10000, parameters = None):
+    """
+    Function that detach deletes the nodes matched by the match clause,
+    in batches of batch_size nodes, so that large deletes
+    do not have to fit in a single transaction of the Neo4j heap.
+    """
+    query = f'{match} WITH n LIMIT $batch_size DETACH DELETE n RETURN count(*)'
+    parameters = {**(parameters or {}), 'batch_size': batch_size}
+    while True:
+        result = database.execute(query, 'w', parameters)
+        if not result or result[0][0] < batch_size:
+            break
     return
 
 
-def create_similarity_graph(database, node_groups, 
-                            en_nlp, el_nlp, lang_det, cutoff):
+def delete_workspace_graph(database, space_id, batch_size = 10000):
     """
-    Function that creates the similarity subgraph in the database,
-    between the discussion nodes created earlier.
+    Function that deletes the nodes & relationships of a single workspace.
+    """
+    delete_in_batches(database, 'MATCH (n:Node {SpaceId: $space_id})', batch_size, {'space_id': space_id})
+
+
+def delete_removed_workspace_graphs(database, space_ids, batch_size = 10000):
+    """
+    Function that deletes the nodes & relationships
+    of all workspaces which are not in the space_ids list.
+    """
+    delete_in_batches(
+        database, 'MATCH (n:Node) WHERE NOT n.SpaceId IN $space_ids', batch_size, {'space_ids': list(space_ids)}
+    )
+
+
+def create_discussion_nodes(database, node_groups, batch_size = 5000):
+    """
+    Function that creates each node in the database,
+    streaming all node groups in batches to a single parameterized query.
+    """
+    rows = [node for nodes in node_groups.values() for node in nodes]
+
+    # Create (or Merge) nodes, if the collection is not empty.
+    if rows:
+        query = (
+            'UNWIND $rows AS node '
+            'MERGE (n:Node {id: node.id}) '
+            'SET n.UserId = node.UserId, n.SpaceId = node.SpaceId, '
+            'n.Position = node.Position, n.DiscussionText = node.DiscussionText'
+        )
+        database.write_in_batches(query, rows, batch_size)
+    return
+
+
+def similarity_edges(node_groups, features, cutoff, block_size = 1024,
+                     ann_threshold = None, max_degree = 10):
+    """
+    Generator that yields the nodes of each node group,
+    alongside their similarity pairs above the cutoff,
+    using the extracted features of each discussion, indexed by its id.
     """
-    
     # Calculate all node groups similarity pairs.
     for label, nodes in node_groups.items():
         if label == 'Issue':
             continue
 
-        # Create the list of texts and ids for all nodes of a specific type.
-        text_ids = [(node['id'], node['DiscussionText']) for node in nodes]
+        # Gather the feature records of all nodes of a specific type.
+        records = [features[node['id']] for node in nodes]
 
         # We need at least two texts to make the comparison.
-        if len(text_ids) < 2:
+        if len(records) < 2:
             continue
-        else:
-            edges = \
-                calc_similarity_pairs(text_ids, en_nlp, el_nlp, lang_det, cutoff)
-
-            # Convert the similarity score to a dict, for the call below.
-            edges = [[source, score, target] for source, score, target in edges]
-
-            # Merge all relationships, depending on source, target id, if they exist.
-            if edges:
-                query = (
-                    f'UNWIND {edges} as row '
-                    'MATCH (s:Node {id: row[0]}), (t:Node{id: row[2]}) '
-                    'MERGE (s)-[r:is_similar]-(t) '
-                    'SET r.score = row[1]'
-                )
-                database.execute(query, 'w')
+
+        yield nodes, calc_similarity_pairs(records, cutoff, block_size, ann_threshold, max_degree)
+
+
+def create_similarity_graph(database, node_groups, features, cutoff,
+                            block_size = 1024, ann_threshold = None, max_degree = 10,
+                            batch_size = 5000):
+    """
+    Function that creates the similarity subgraph in the database,
+    between the discussion nodes created earlier, using the
+    extracted features of each discussion, indexed by its id.
+    Nodes are only matched inside their own workspace.
+    """
+    for nodes, edges in similarity_edges(node_groups, features, cutoff,
+                                         block_size, ann_threshold, max_degree):
+
+        # Merge all relationships, depending on source, target id, if they exist.
+        if edges:
+            query = (
+                'UNWIND $rows AS row '
+                'MATCH (s:Node {id: row[0]}), (t:Node {id: row[2]}) '
+                'WHERE s.SpaceId = $space_id AND t.SpaceId = $space_id '
+                'MERGE (s)-[r:is_similar]-(t) '
+                'SET r.score = row[1]'
+            )
+            database.write_in_batches(
+                query, [list(edge) for edge in edges], batch_size,
+                {'space_id': nodes[0]['SpaceId']}
+            )
 
     return
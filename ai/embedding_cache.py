@@ -0,0 +1,200 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+from collections import OrderedDict
+import ai.config
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding store, which keeps the vectors in a memory-mapped
+    float32 matrix and a key -> row index in least recently used order.
+    Keys are built from the model name, the language, the namespace
+    of the embedding stage and the hash of the normalized text.
+    Each row also stores the checksum of its key & vector, which is checked
+    on read, so that a row reused after the index was last persisted,
+    e.g. by a run which crashed before flushing, is never served.
+    """
+    __default = None
+
+    def __init__(self, path, dim = 300, capacity = 100000, read_only = False):
+        self.path, self.dim, self.capacity = path, dim, capacity
+        self.read_only = read_only
+        self.hits, self.misses, self.evictions = 0, 0, 0
+        if not read_only:
+            os.makedirs(path, exist_ok = True)
+
+        vectors_path = os.path.join(path, 'vectors.f32')
+        checksums_path = os.path.join(path, 'checksums.bin')
+        index_path = os.path.join(path, 'index.json')
+
+        # Reuse the stored index, only if it was created with the same shape.
+        self.__index = OrderedDict()
+        if all(os.path.exists(file_path) for file_path in [vectors_path, checksums_path, index_path]):
+            with open(index_path, encoding = 'utf-8') as f:
+                stored = json.load(f)
+            if stored['dim'] == dim and stored['capacity'] == capacity:
+                self.__index = OrderedDict(stored['rows'])
+
+        # A read-only cache never writes to the store; instead it keeps
+        # the keys it read and the vectors it embedded, until they are taken,
+        # so that the process which owns the store merges them.
+        self.__used_keys, self.__new_vectors = [], {}
+        if read_only:
+            self.__vectors = self.__checksums = None
+            if self.__index:
+                self.__vectors = np.memmap(vectors_path, dtype = np.float32, mode = 'r', shape = (capacity, dim))
+                self.__checksums = np.memmap(checksums_path, dtype = np.uint8, mode = 'r', shape = (capacity, 20))
+            self.__free_rows = []
+            return
+
+        mode = 'r+' if self.__index else 'w+'
+        self.__vectors = np.memmap(vectors_path, dtype = np.float32, mode = mode, shape = (capacity, dim))
+        self.__checksums = np.memmap(checksums_path, dtype = np.uint8, mode = mode, shape = (capacity, 20))
+        used_rows = set(self.__index.values())
+        self.__free_rows = [row for row in range(capacity - 1, -1, -1) if row not in used_rows]
+
+    @classmethod
+    def default(cls, read_only = False):
+        """
+        Class method which returns the cache shared by the whole process,
+        configured from ai.config. The worker processes of the pipeline
+        open it read-only, since only the main process writes to the store.
+        """
+        if cls.__default is None:
+            cls.__default = cls(
+                ai.config.embedding_cache_dir,
+                ai.config.embedding_cache_dim,
+                ai.config.embedding_cache_capacity,
+                read_only
+            )
+        return cls.__default
+
+    @staticmethod
+    def model_name(nlp):
+        return f'{nlp.meta["lang"]}_{nlp.meta["name"]}-{nlp.meta["version"]}'
+
+    @staticmethod
+    def key(model_name, language, namespace, text):
+        normalized = ' '.join(text.split())
+        digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+        return f'{model_name}|{language}|{namespace}|{digest}'
+
+    @staticmethod
+    def checksum(key, vector):
+        return hashlib.sha1(key.encode('utf-8') + np.asarray(vector, dtype = np.float32).tobytes()).digest()
+
+    def __read_row(self, key):
+        # Return the row of the key, only if it still holds the vector of the key.
+        row = self.__index.get(key)
+        if row is None:
+            return None
+        if self.__checksums[row].tobytes() != EmbeddingCache.checksum(key, self.__vectors[row]):
+            del self.__index[key]
+            if not self.read_only:
+                self.__free_rows.append(row)
+            return None
+        return row
+
+    def __store(self, key, vector):
+        # Store the vector in a free (or the least recently used) row.
+        row = self.__allocate_row()
+        self.__vectors[row] = vector
+        self.__checksums[row] = np.frombuffer(EmbeddingCache.checksum(key, vector), dtype = np.uint8)
+        self.__index[key] = row
+
+    def __allocate_row(self):
+        # Evict the least recently used entry, if the store is full.
+        if not self.__free_rows:
+            _, row = self.__index.popitem(last = False)
+            self.evictions += 1
+            return row
+        return self.__free_rows.pop()
+
+    def vectors(self, nlp, language, namespace, texts, embed):
+        """
+        Method which returns the (len(texts), dim) matrix of embeddings,
+        reading the cached ones from the store and calling embed
+        only on the list of missing texts, whose vectors are then stored.
+        """
+        model_name = EmbeddingCache.model_name(nlp)
+        keys = [EmbeddingCache.key(model_name, language, namespace, text) for text in texts]
+        matrix = np.empty((len(texts), self.dim), dtype = np.float32)
+
+        # Read all cached vectors and mark them as recently used.
+        missing = {}
+        for i, key in enumerate(keys):
+            if key in self.__new_vectors:
+                matrix[i] = self.__new_vectors[key]
+                continue
+            row = self.__read_row(key)
+            if row is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                self.__index.move_to_end(key)
+                if self.read_only:
+                    self.__used_keys.append(key)
+                matrix[i] = self.__vectors[row]
+        self.hits += len(texts) - sum(map(len, missing.values()))
+        self.misses += sum(map(len, missing.values()))
+
+        if missing:
+            embedded = np.asarray(
+                embed([texts[positions[0]] for positions in missing.values()]),
+                dtype = np.float32
+            )
+            if embedded.shape[1] != self.dim:
+                raise ValueError(f'Expected {self.dim}-dimensional embeddings, got {embedded.shape[1]}!')
+
+            # Store each new vector and copy it to all of its positions.
+            for (key, positions), vector in zip(missing.items(), embedded):
+                if self.read_only:
+                    self.__new_vectors[key] = vector
+                else:
+                    self.__store(key, vector)
+                matrix[positions] = vector
+        return matrix
+
+    def take_updates(self):
+        """
+        Method which returns and forgets the keys read and the vectors embedded
+        by a read-only cache, since they were last taken, for merge.
+        """
+        updates = (self.__used_keys, self.__new_vectors)
+        self.__used_keys, self.__new_vectors = [], {}
+        return updates
+
+    def merge(self, used_keys, new_vectors):
+        """
+        Method which merges the updates of a read-only cache into the store,
+        marking its read keys as recently used and storing its new vectors.
+        """
+        for key in used_keys:
+            if key in self.__index:
+                self.__index.move_to_end(key)
+        for key, vector in new_vectors.items():
+            if key not in self.__index:
+                self.__store(key, np.asarray(vector, dtype = np.float32))
+
+    def flush(self):
+        """
+        Method which persists the vectors and the index on disk.
+        """
+        if self.read_only:
+            return
+        self.__vectors.flush()
+        self.__checksums.flush()
+        index_path = os.path.join(self.path, 'index.json')
+        with open(f'{index_path}.tmp', 'w', encoding = 'utf-8') as f:
+            json.dump({
+                'dim': self.dim,
+                'capacity': self.capacity,
+                'rows': list(self.__index.items())
+            }, f)
+        os.replace(f'{index_path}.tmp', index_path)
+        logging.info(
+            f'Embedding cache: {self.hits} hits, {self.misses} misses, '
+            f'{self.evictions} evictions, {len(self.__index)}/{self.capacity} rows used.'
+        )
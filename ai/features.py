@@ -0,0 +1,67 @@
+from ai.utils import (
+    counter,
+    pipe_stage,
+    detect_languages,
+    preprocess_doc,
+    remove_punctuation_and_whitespace
+)
+from ai.embedding_cache import EmbeddingCache
+
+
+def token_vectors(nlp, language, texts):
+    """
+    Function which returns the tokenizer-only document vectors of the texts,
+    reading the vectors of unchanged texts from the embedding cache.
+    """
+    return EmbeddingCache.default().vectors(
+        nlp, language, 'tokens', texts,
+        lambda texts: [doc.vector for doc in pipe_stage(nlp, 'vectors', texts)]
+    )
+
+
+def extract_text_features(discussions, lang_det):
+    """
+    Function which extends each discussion with only its Language
+    and CleanText, i.e. the features the classifier is trained on.
+    """
+    languages = detect_languages(lang_det, [discussion['DiscussionText'] for discussion in discussions])
+
+    for discussion, language in zip(discussions, languages):
+        discussion['Language'] = language
+        discussion['CleanText'] = remove_punctuation_and_whitespace(discussion['DiscussionText'])
+    return discussions
+
+
+@counter
+def extract_features(discussions, en_nlp, el_nlp, lang_det):
+    """
+    Function which computes the features of each discussion once per run,
+    so that the classifier, the clusterer and the similarity graph share them.
+    Each discussion is extended with its Language, CleanText,
+    PreprocessedText, Vector (of the clean text)
+    and PreprocessedVector (of the preprocessed text).
+    """
+    extract_text_features(discussions, lang_det)
+
+    for discussion in discussions:
+        discussion['PreprocessedText'] = ''
+        discussion['Vector'] = discussion['PreprocessedVector'] = None
+
+    for language, nlp in (('english', en_nlp), ('greek', el_nlp)):
+        group = [discussion for discussion in discussions if discussion['Language'] == language]
+        if not group:
+            continue
+
+        # Tag all texts of the language in a single pass, then filter their tokens.
+        docs = pipe_stage(nlp, 'tagging', (discussion['DiscussionText'] for discussion in group))
+        for discussion, doc in zip(group, docs):
+            discussion['PreprocessedText'] = preprocess_doc(doc, nlp, language)
+
+        # Embed both the clean and the preprocessed texts.
+        vectors = token_vectors(nlp, language, [discussion['CleanText'] for discussion in group])
+        preprocessed_vectors = token_vectors(nlp, language, [discussion['PreprocessedText'] for discussion in group])
+        for discussion, vector, preprocessed_vector in zip(group, vectors, preprocessed_vectors):
+            discussion['Vector'] = vector
+            discussion['PreprocessedVector'] = preprocessed_vector
+
+    return discussions
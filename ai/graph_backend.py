@@ -0,0 +1,172 @@
+import numpy as np
+import scipy.sparse as sp
+from ai.neo4j_wrapper import GraphAlgos
+from ai.create import (
+    delete_workspace_graph,
+    create_discussion_nodes,
+    create_similarity_graph,
+    similarity_edges
+)
+from ai.select import extract_id_texts_from_communities
+
+
+def local_moving(adjacency, max_iterations = 10, resolution = 1.0):
+    """
+    Function which runs the local moving phase of Louvain:
+    each node repeatedly joins the neighbouring community
+    with the largest modularity gain, until no node moves.
+    """
+    n = adjacency.shape[0]
+    degrees = np.asarray(adjacency.sum(axis = 1)).ravel()
+    total_weight = degrees.sum() # Twice the weight of all edges.
+    labels = np.arange(n)
+
+    if total_weight == 0:
+        return labels, False
+
+    community_degrees = degrees.copy()
+    indptr, indices, data = adjacency.indptr, adjacency.indices, adjacency.data
+    moved_any = False
+
+    for _ in range(max_iterations):
+        moved = False
+        for i in range(n):
+            current, degree = labels[i], degrees[i]
+
+            # Sum the weights from this node to each neighbouring community.
+            weights = {}
+            for ptr in range(indptr[i], indptr[i + 1]):
+                j = indices[ptr]
+                if j != i:
+                    weights[labels[j]] = weights.get(labels[j], 0.0) + data[ptr]
+
+            # Remove the node from its community, then find its best community.
+            community_degrees[current] -= degree
+            best = current
+            best_gain = weights.get(current, 0.0) - resolution * degree * community_degrees[current] / total_weight
+            for community, weight in weights.items():
+                gain = weight - resolution * degree * community_degrees[community] / total_weight
+                if gain > best_gain:
+                    best, best_gain = community, gain
+            community_degrees[best] += degree
+
+            if best != current:
+                labels[i], moved = best, True
+        if not moved:
+            break
+        moved_any = True
+    return labels, moved_any
+
+
+def louvain_communities(adjacency, max_levels = 10, max_iterations = 10, resolution = 1.0):
+    """
+    Function which detects the communities of an undirected graph,
+    given as a symmetric SciPy sparse adjacency matrix, using Louvain.
+    Each level moves nodes locally and then aggregates each community
+    into a single node, until the communities no longer change.
+    Returns the community of each node.
+    """
+    adjacency = sp.csr_matrix(adjacency, dtype = np.float64)
+    membership = np.arange(adjacency.shape[0])
+
+    for _ in range(max_levels):
+        labels, moved = local_moving(adjacency, max_iterations, resolution)
+        if not moved:
+            break
+
+        # Renumber the communities and aggregate them: A' = P^T A P.
+        _, labels = np.unique(labels, return_inverse = True)
+        membership = labels[membership]
+        assignment = sp.csr_matrix(
+            (np.ones(len(labels)), (np.arange(len(labels)), labels))
+        )
+        adjacency = (assignment.T @ adjacency @ assignment).tocsr()
+    return membership
+
+
+class Neo4jGraph:
+    """
+    Graph backend which stores the similarity graph of a workspace
+    in Neo4j, and detects its communities using GDS.
+    """
+    def __init__(self, database, space_id, max_memory_bytes = None, delete_batch_size = 10000):
+        self.database, self.space_id = database, space_id
+        self.max_memory_bytes = max_memory_bytes
+        self.delete_batch_size = delete_batch_size
+
+    def create(self, node_groups, features, cutoff, block_size = 1024,
+               ann_threshold = None, max_degree = 10, batch_size = 5000):
+        # Delete the graph of this workspace only, then create its nodes and edges.
+        delete_workspace_graph(self.database, self.space_id, self.delete_batch_size)
+        create_discussion_nodes(self.database, node_groups, batch_size)
+        create_similarity_graph(
+            self.database, node_groups, features, cutoff,
+            block_size, ann_threshold, max_degree, batch_size
+        )
+
+    def louvain(self, max_levels = 10, max_iterations = 10):
+        with GraphAlgos(self.database, ['Node'], ['is_similar'], space_id = self.space_id,
+                        max_memory_bytes = self.max_memory_bytes) as similarity_graph:
+            similarity_graph.louvain('community', max_levels, max_iterations)
+
+    def communities(self):
+        return extract_id_texts_from_communities(self.database, self.space_id)
+
+
+class InProcessGraph:
+    """
+    Graph backend which keeps the similarity graph of a workspace
+    in a SciPy sparse adjacency matrix, and detects its communities
+    in-process, so that no Neo4j server is needed.
+    """
+    def __init__(self):
+        self.nodes, self.community = [], {}
+        self.adjacency = sp.csr_matrix((0, 0))
+
+    def create(self, node_groups, features, cutoff, block_size = 1024,
+               ann_threshold = None, max_degree = 10, batch_size = None):
+        self.nodes = [node for nodes in node_groups.values() for node in nodes]
+        index = {node['id']: i for i, node in enumerate(self.nodes)}
+
+        # Gather all similarity pairs as (unweighted) undirected edges.
+        sources, targets = [], []
+        for _, edges in similarity_edges(node_groups, features, cutoff,
+                                         block_size, ann_threshold, max_degree):
+            for source, _, target in edges:
+                sources.append(index[source])
+                targets.append(index[target])
+
+        n = len(self.nodes)
+        adjacency = sp.coo_matrix(
+            (np.ones(len(sources)), (sources, targets)), shape = (n, n)
+        ).tocsr()
+        self.adjacency = ((adjacency + adjacency.T) > 0).astype(np.float64)
+
+    def louvain(self, max_levels = 10, max_iterations = 10):
+        membership = louvain_communities(self.adjacency, max_levels, max_iterations)
+        self.community = {
+            node['id']: int(community)
+            for node, community in zip(self.nodes, membership)
+        }
+
+    def communities(self):
+        """
+        Method which returns the same dictionary as extract_id_texts_from_communities,
+        i.e. community -> (position, ids, joined text), for all nodes with an edge.
+        The ids & texts are deduplicated with insertion-ordered dicts,
+        which keep their first-seen order, like COLLECT(DISTINCT ...).
+        """
+        grouped = {}
+        degrees = np.asarray(self.adjacency.sum(axis = 1)).ravel()
+        for node, degree in zip(self.nodes, degrees):
+            if degree == 0 or node['id'] not in self.community:
+                continue
+            position, ids, texts = grouped.setdefault(
+                self.community[node['id']], (node['Position'], {}, {})
+            )
+            ids[node['id']] = None
+            texts[node['DiscussionText']] = None
+        return {
+            community: (position, list(ids), ' '.join(text for text in texts).replace('\n', ' '))
+            for community, (position, ids, texts) in grouped.items()
+        }
@@ -0,0 +1,233 @@
+import json
+import codecs
+import logging
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+import ai.config
+from ai.utils import (
+    remove_html,
+    ERGOLOGIC_WORKSPACES_URL,
+    ERGOLOGIC_DISCUSSIONS_URL
+)
+
+
+def ergologic_session(retries = 3, pool_size = 10):
+    """
+    Function which creates a pooled HTTP session, which retries
+    the failed GET requests to the Ergologic backend with backoff.
+    """
+    retry = Retry(
+        total = retries, backoff_factor = 1,
+        status_forcelist = [429, 500, 502, 503, 504],
+        allowed_methods = ['GET']
+    )
+    adapter = HTTPAdapter(max_retries = retry, pool_connections = pool_size, pool_maxsize = pool_size)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def iter_json_array(chunks):
+    """
+    Function which incrementally parses a JSON array from chunks of bytes,
+    and yields each of its items as soon as it is complete,
+    so the whole response is never held in memory.
+    """
+    decoder, buffer = json.JSONDecoder(), ''
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    started = False
+
+    for chunk in chunks:
+        buffer += utf8.decode(chunk)
+        position = 0
+        while True:
+            # Skip the whitespace and the separators between the items.
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError('The response is not a JSON array.')
+                started, position = True, position + 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break # The item is incomplete, read the next chunk.
+
+            # An item is complete only if it is followed by a delimiter,
+            # e.g. a number split at its '.' or 'e' continues in the next chunk.
+            following = end
+            while following < len(buffer) and buffer[following] in ' \t\r\n':
+                following += 1
+            if following == len(buffer) or buffer[following] not in ',]':
+                break
+            yield item
+            position = end
+        buffer = buffer[position:]
+    raise ValueError('The JSON array is incomplete.')
+
+
+def fetch_items(session, url, params = None, page_size = 0, timeout = 30, max_pages = 10000):
+    """
+    Function which streams the items of a JSON array endpoint.
+    If a page size is given, the items are fetched page by page,
+    using the limit/offset parameters, until a page is not full.
+    If the upstream ignores these parameters, i.e. a page holds more items
+    than the page size, or starts with the same item as the previous page,
+    the pagination stops, so that no item is yielded twice.
+    """
+    params, offset, first_id = dict(params or {}), 0, None
+    for _ in range(max_pages if page_size else 1):
+        if page_size:
+            params.update({
+                ai.config.ergologic_limit_param: page_size,
+                ai.config.ergologic_offset_param: offset
+            })
+        with session.get(url, params = params, stream = True, timeout = timeout) as response:
+            response.raise_for_status()
+            count = 0
+            for item in iter_json_array(response.iter_content(chunk_size = 64 * 1024)):
+                if count == 0 and page_size:
+                    if offset and item.get('id') == first_id:
+                        logging.warning(f'{url} ignores the offset parameter, stopped paginating.')
+                        return
+                    first_id = item.get('id')
+                count += 1
+                yield item
+        if not page_size or count < page_size:
+            return
+        if count > page_size:
+            logging.warning(f'{url} ignores the limit parameter, stopped paginating.')
+            return
+        offset += count
+    logging.warning(f'{url} returned more than {max_pages} pages, stopped paginating.')
+
+
+def clean_workspace(wsp):
+    return {
+        'id': wsp['id'],
+        'OwnerId': wsp['OwnerId'],
+        'Description': remove_html(wsp['Description']),
+        'Summary': remove_html(wsp['Summary'])
+    }
+
+
+def clean_discussion(discussion):
+    return {
+        'id': discussion['id'],
+        'SpaceId': discussion['SpaceId'],
+        'UserId': discussion['UserId'],
+        'Position': ai.config.position_number_to_string.get(discussion['Position'], 'Issue'),
+        'DiscussionText': remove_html(discussion['DiscussionText'])
+    }
+
+
+def fetch_discussions(session, space_id = None, since = None):
+    """
+    Function which streams the cleaned discussions, only of a workspace,
+    or only those changed since a date, if the upstream supports these filters.
+    """
+    params = {}
+    if space_id is not None and ai.config.ergologic_space_param:
+        params[ai.config.ergologic_space_param] = space_id
+    if since is not None and ai.config.ergologic_since_param:
+        params[ai.config.ergologic_since_param] = since.isoformat()
+    for discussion in fetch_items(session, ERGOLOGIC_DISCUSSIONS_URL, params,
+                                  ai.config.ergologic_page_size, ai.config.ergologic_timeout,
+                                  ai.config.ergologic_max_pages):
+        yield clean_discussion(discussion)
+
+
+def fetch_workspaces(session):
+    return [
+        clean_workspace(wsp)
+        for wsp in fetch_items(session, ERGOLOGIC_WORKSPACES_URL, None,
+                               ai.config.ergologic_page_size, ai.config.ergologic_timeout,
+                               ai.config.ergologic_max_pages)
+    ]
+
+
+def group_by_space(discussions, space_ids):
+    """
+    Function which groups the discussions of the given workspaces by their SpaceId,
+    ignoring those of unknown workspaces.
+    """
+    grouped = {space_id: [] for space_id in space_ids}
+    for discussion in discussions:
+        if discussion['SpaceId'] in grouped:
+            grouped[discussion['SpaceId']].append(discussion)
+    return grouped
+
+
+def iter_space_discussions(session, space_ids, since = None, workers = 4):
+    """
+    Function which fetches the discussions of each workspace concurrently,
+    and yields them by SpaceId, keeping at most as many workspaces
+    in flight as there are workers.
+    """
+    with ThreadPoolExecutor(max_workers = workers) as executor:
+        pending = deque()
+        for space_id in space_ids:
+            pending.append(
+                (space_id, executor.submit(list, fetch_discussions(session, space_id, since)))
+            )
+            if len(pending) >= workers:
+                space_id, future = pending.popleft()
+                yield space_id, future.result()
+        while pending:
+            space_id, future = pending.popleft()
+            yield space_id, future.result()
+
+
+def closing_groups(session, groups):
+    """
+    Function which yields the (SpaceId, discussions) groups,
+    and closes the session, once they are consumed or discarded.
+    """
+    try:
+        yield from groups
+    finally:
+        session.close()
+
+
+def ingest_ergologic(since = None):
+    """
+    Function which fetches the workspaces from the Ergologic backend
+    and returns them, alongside an iterator of (SpaceId, discussions).
+    If the upstream can filter the discussions by workspace, each workspace
+    is fetched separately and concurrently, so memory is bounded by the
+    largest workspace; otherwise both endpoints are fetched concurrently.
+    The HTTP session is closed, once the groups are consumed.
+    Returns None if the Ergologic backend cannot be reached.
+    """
+    session = ergologic_session(ai.config.ergologic_retries, ai.config.ergologic_fetch_workers)
+    try:
+        if ai.config.ergologic_space_param:
+            workspaces = fetch_workspaces(session)
+            groups = iter_space_discussions(
+                session, [wsp['id'] for wsp in workspaces], since, ai.config.ergologic_fetch_workers
+            )
+        else:
+            with ThreadPoolExecutor(max_workers = 2) as executor:
+                workspaces_future = executor.submit(fetch_workspaces, session)
+                discussions_future = executor.submit(list, fetch_discussions(session, None, since))
+                workspaces = workspaces_future.result()
+                groups = iter(group_by_space(
+                    discussions_future.result(), [wsp['id'] for wsp in workspaces]
+                ).items())
+    except requests.RequestException as e:
+        session.close()
+        logging.error(f'The Ergologic backend could not be reached: {e}')
+        return
+    except Exception:
+        session.close()
+        raise
+    return workspaces, closing_groups(session, groups)
@@ -1,95 +1,349 @@
-import sys
-import traceback
+import os
+import time
+import uuid
+import logging
+from collections import defaultdict
 from neo4j import GraphDatabase
-from neo4j.exceptions import Neo4jError
+import ai.config
 
 
 class Neo4jDatabase(object): 
     """
     Wrapper class which handles the Neo4j  
     database driver by abstracting repeating code.
+    The driver keeps a pool of connections, so a single
+    long-lived instance should be shared by each process.
     """
+    __shared, __shared_pid = None, None
+
     def __init__(self, uri, user, password): # Create the database connection.
-        self.driver = GraphDatabase.driver(uri, auth = (user, password))
+        self.driver = GraphDatabase.driver(
+            uri, auth = (user, password),
+            max_connection_pool_size = ai.config.neo4j_max_connection_pool_size,
+            connection_acquisition_timeout = ai.config.neo4j_connection_acquisition_timeout,
+            max_transaction_retry_time = ai.config.neo4j_max_transaction_retry_time
+        )
+        # The number of calls and the total duration of each query.
+        self.timings = defaultdict(lambda: [0, 0.0])
+
+    @classmethod
+    def shared(cls):
+        """
+        Class method which returns the database of the current process,
+        creating its driver on first use, or after a fork,
+        since a pooled driver must never be shared between processes.
+        """
+        if cls.__shared is None or cls.__shared_pid != os.getpid():
+            cls.__shared = cls(ai.config.neo4j_connection_string, ai.config.neo4j_user, ai.config.neo4j_pwd)
+            cls.__shared_pid = os.getpid()
+        return cls.__shared
 
     def close(self):
         self.driver.close()
 
-    def execute(self, query, mode): # Execute a query using a database session.
+    def ping(self):
+        """
+        Method which runs a trivial query without retries,
+        and raises an exception if Neo4j does not accept queries yet.
+        """
+        with self.driver.session() as session:
+            session.run('RETURN 1').consume()
+
+    def __timed(self, query, started):
+        timing = self.timings[query]
+        timing[0] += 1
+        timing[1] += time.perf_counter() - started
+
+    def execute_read(self, query, parameters = None):
+        """
+        Method which runs a query in a managed read transaction,
+        retried on transient errors, and returns its values.
+        """
+        started = time.perf_counter()
+        with self.driver.session() as session:
+            result = session.read_transaction(
+                lambda tx: tx.run(query, parameters).values()
+            )
+        self.__timed(query, started)
+        return result
+
+    def execute_write(self, query, parameters = None):
+        """
+        Method which runs a query in a managed write transaction,
+        retried on transient errors, and returns its values.
+        """
+        started = time.perf_counter()
         with self.driver.session() as session:
-            result = None
-            try:
-                 result = session.run(query)
-                 if (mode in 'rw'): # Read / Write query.
-                    result = result.values()
-                 elif(mode == 'g'): # Graph data query.
-                    result = result.data()
-                 else:
-                    raise TypeError('Execution mode can either be (r)ead, (w)rite or (g)raph data!')
-            except Neo4jError as err:
-                print(err, file = sys.stderr) # Print the error instead of breaking the execution.
+            result = session.write_transaction(
+                lambda tx: tx.run(query, parameters).values()
+            )
+        self.__timed(query, started)
         return result
 
+    def execute_many(self, statements):
+        """
+        Method which runs a list of (query, parameters) statements
+        inside a single managed write transaction, so that they
+        are committed (or retried) together.
+        """
+        def run(tx):
+            for query, parameters in statements:
+                tx.run(query, parameters).consume()
+
+        started = time.perf_counter()
+        with self.driver.session() as session:
+            session.write_transaction(run)
+        self.__timed('; '.join(query for query, _ in statements), started)
+
+    def stream(self, query, parameters = None):
+        """
+        Generator which yields the records of a read query one at a time,
+        as they arrive from the server, instead of materializing them.
+        """
+        started = time.perf_counter()
+        with self.driver.session(default_access_mode = 'READ') as session:
+            for record in session.run(query, parameters):
+                yield record.values()
+        self.__timed(query, started)
+
+    def execute(self, query, mode, parameters = None): # Execute a query using a database session.
+        """
+        Method which runs a query in a managed read or write transaction,
+        so that transient errors are retried, while any other error
+        (e.g. a failed write or GDS procedure) is raised to the caller.
+        """
+        if mode == 'r': # Read query.
+            return self.execute_read(query, parameters)
+        elif mode == 'w': # Write query.
+            return self.execute_write(query, parameters)
+        elif mode == 'g': # Graph data query.
+            started = time.perf_counter()
+            with self.driver.session() as session:
+                result = session.read_transaction(
+                    lambda tx: tx.run(query, parameters).data()
+                )
+            self.__timed(query, started)
+            return result
+        raise TypeError('Execution mode can either be (r)ead, (w)rite or (g)raph data!')
+
+    def write_in_batches(self, query, rows, batch_size = 5000, parameters = None):
+        """
+        Method which streams the rows to a parameterized query, which unwinds $rows,
+        in chunks of batch_size rows, each one inside an explicit write transaction.
+        Since the query string never changes, its plan is cached by Neo4j.
+        Each batch is retried on transient errors; any other error is raised,
+        so that no batch is silently dropped.
+        """
+        def run(tx, batch):
+            tx.run(query, {**(parameters or {}), 'rows': batch}).consume()
+
+        with self.driver.session() as session:
+            for start in range(0, len(rows), batch_size):
+                started = time.perf_counter()
+                session.write_transaction(run, rows[start:start + batch_size])
+                self.__timed(query, started)
+
+    def log_timings(self):
+        """
+        Method which logs the number of calls & total duration of each query,
+        slowest first, and resets the counters.
+        """
+        for query, (calls, duration) in sorted(self.timings.items(), key = lambda item: -item[1][1]):
+            logging.info(f'Neo4j: {calls} calls, {duration:.3f} secs: {query[:200]}')
+        self.timings.clear()
+
 
 class GraphAlgos:
     """
     Wrapper class which handle the graph algorithms 
     more efficiently, by abstracting repeating code.
+    The graph is projected once in memory, under a unique name,
+    when entering the with statement, shared by all algorithms
+    and dropped on exit.
     """
-    database = None # Static variable shared across objects.
+    projection_procedure = None # Static variable, depending on the GDS version.
+
+    def __init__(self, database, node_list, rel_list, orientation = "NATURAL",
+                 space_id = None, max_memory_bytes = None):
+        self.database = database
+        self.graph_name = f'graph_{space_id if space_id is not None else "all"}_{uuid.uuid4().hex[:8]}'
+        self.max_memory_bytes = max_memory_bytes
+        self.space_id = space_id
 
-    def __init__(self, database, node_list, rel_list, orientation = "NATURAL"):
-        # Initialize the static variable and class member.
-        if GraphAlgos.database is None:
-            GraphAlgos.database = database
+        # Project only the nodes & relationships of a single workspace.
+        if space_id is not None:
+            labels = ' OR '.join(f'n:{node}' for node in node_list)
+            self.node_query = f'MATCH (n) WHERE ({labels}) AND n.SpaceId = $space_id RETURN id(n) AS id'
+            rels = [
+                (rel, orientation, []) if type(rel) is str
+                else (rel[0], rel[1], GraphAlgos.property_names(rel[2]))
+                for rel in rel_list
+            ]
+            # The union of the relationship queries requires the same columns.
+            if len({tuple(properties) for _, _, properties in rels}) > 1:
+                raise ValueError('The Cypher projection requires the same properties for all relationships!')
+            self.rel_query = ' UNION ALL '.join(
+                GraphAlgos.cypher_relationships(*rel) for rel in rels
+            )
+            return
 
-        # Construct the relationship string.
+        # Construct the relationship projection.
         if type(rel_list[0]) is str:
-            rel_string = ', '.join(
-                (f'{rel}: {{type: "{rel}", orientation: "{orientation}"}}')
-                for rel in rel_list)
+            self.rel_projection = {
+                rel: {'type': rel, 'orientation': orientation}
+                for rel in rel_list
+            }
+        else:
+            self.rel_projection = {
+                rel[0]: {'type': rel[0], 'orientation': rel[1], 'properties': rel[2]}
+                for rel in rel_list
+            }
+        self.node_projection = node_list
+
+    @staticmethod
+    def property_names(properties):
+        """
+        Static method which returns the names of the relationship properties,
+        since the Cypher projection only supports properties given by name.
+        """
+        if isinstance(properties, str):
+            return [properties]
+        if not isinstance(properties, (list, tuple)):
+            raise ValueError('The Cypher projection only supports relationship properties given by name!')
+        return list(properties)
+
+    @staticmethod
+    def cypher_relationships(rel_type, orientation, properties):
+        """
+        Static method which returns the Cypher query of the relationships
+        of a type inside a workspace, in the given orientation,
+        alongside the given properties (names only), as columns.
+        """
+        if orientation == 'UNDIRECTED':
+            # An undirected pattern matches each relationship in both directions.
+            pattern, source, target = f'(s)-[r:{rel_type}]-(t)', 's', 't'
+        elif orientation in ('NATURAL', 'REVERSE'):
+            pattern = f'(s)-[r:{rel_type}]->(t)'
+            source, target = ('t', 's') if orientation == 'REVERSE' else ('s', 't')
         else:
-            rel_string = ', '.join(
-                (f'{rel[0]}: {{type: "{rel[0]}", orientation: "{rel[1]}", properties: {rel[2]}}}')
-                for rel in rel_list)
-
-        # Construct the projection of the anonymous graph.
-        self.graph_projection = (
-            f'{{nodeProjection: {node_list}, '
-            f'relationshipProjection: {{{rel_string}}}'
+            raise ValueError(f'Unsupported orientation {orientation}!')
+        columns = ''.join(f', r.{name} AS {name}' for name in properties)
+        return (
+            f'MATCH {pattern} WHERE s.SpaceId = $space_id AND t.SpaceId = $space_id '
+            f'RETURN id({source}) AS source, id({target}) AS target, type(r) AS type{columns}'
         )
 
-    def pagerank(self, write_property, max_iterations = 20, damping_factor = 0.85):
-        setup = (f'{self.graph_projection}, '
-            f'writeProperty: "{write_property}", '
-            f'maxIterations: {max_iterations}, '
-            f'dampingFactor: {damping_factor}}}'
+    @classmethod
+    def projection(cls, database):
+        """
+        Class method which returns the graph projection procedure,
+        gds.graph.project since GDS 2.0, or gds.graph.create before it.
+        """
+        if cls.projection_procedure is None:
+            version = database.execute('RETURN gds.version()', 'r')
+            major = int(version[0][0].split('.')[0]) if version else 1
+            cls.projection_procedure = 'gds.graph.project' if major >= 2 else 'gds.graph.create'
+        return cls.projection_procedure
+
+    def __check_memory(self, estimate):
+        # Refuse the job, if its estimated memory does not fit the limit.
+        if self.max_memory_bytes is not None and estimate and estimate[0][0] > self.max_memory_bytes:
+            raise MemoryError(
+                f'{self.graph_name}: estimated {estimate[0][0]} bytes, '
+                f'exceeding the limit of {self.max_memory_bytes} bytes!'
+            )
+
+    def estimate_projection(self):
+        """
+        Method which returns the maximum estimated bytes of the projection.
+        """
+        if self.space_id is not None:
+            estimate = self.database.execute(
+                f'CALL {GraphAlgos.projection(self.database)}.cypher.estimate($node_query, $rel_query, '
+                '{parameters: {space_id: $space_id}}) YIELD bytesMax RETURN bytesMax', 'r',
+                {'node_query': self.node_query, 'rel_query': self.rel_query, 'space_id': self.space_id}
+            )
+        else:
+            estimate = self.database.execute(
+                f'CALL {GraphAlgos.projection(self.database)}.estimate($nodes, $rels) '
+                'YIELD bytesMax RETURN bytesMax', 'r',
+                {'nodes': self.node_projection, 'rels': self.rel_projection}
+            )
+        return estimate
+
+    def estimate(self, algorithm, mode, config):
+        """
+        Method which returns the maximum estimated bytes
+        of running an algorithm (e.g. louvain) in a mode (e.g. write).
+        """
+        return self.database.execute(
+            f'CALL gds.{algorithm}.{mode}.estimate($graph_name, $config) '
+            'YIELD bytesMax RETURN bytesMax', 'r',
+            {'graph_name': self.graph_name, 'config': config}
         )
-        GraphAlgos.database.execute(f'CALL gds.pageRank.write({setup})', 'w')
-
-    def nodeSimilarity(self, write_property, write_relationship, cutoff = 0.5, top_k = 10):
-        setup = (f'{self.graph_projection}, '
-            f'writeProperty: "{write_property}", '
-            f'writeRelationshipType: "{write_relationship}", '
-            f'similarityCutoff: {cutoff}, '
-            f'topK: {top_k}}}'
+
+    def __run(self, algorithm, mode, config):
+        self.__check_memory(self.estimate(algorithm, mode, config))
+        self.database.execute(
+            f'CALL gds.{algorithm}.{mode}($graph_name, $config)', 'w',
+            {'graph_name': self.graph_name, 'config': config}
         )
-        query = f'CALL gds.nodeSimilarity.write({setup})'
-        GraphAlgos.database.execute(f'CALL gds.nodeSimilarity.write({setup})', 'w')
-
-    def louvain(self, write_property, max_levels = 10, max_iterations = 10):
-        setup = (f'{self.graph_projection}, '
-            f'writeProperty: "{write_property}", '
-            f'maxLevels: {max_levels}, '
-            f'maxIterations: {max_iterations}}}'
+
+    def pagerank(self, write_property, max_iterations = 20, damping_factor = 0.85, mutate = False):
+        mode = 'mutate' if mutate else 'write'
+        self.__run('pageRank', mode, {
+            f'{mode}Property': write_property,
+            'maxIterations': max_iterations,
+            'dampingFactor': damping_factor
+        })
+
+    def nodeSimilarity(self, write_property, write_relationship, cutoff = 0.5, top_k = 10, mutate = False):
+        mode = 'mutate' if mutate else 'write'
+        self.__run('nodeSimilarity', mode, {
+            f'{mode}Property': write_property,
+            f'{mode}RelationshipType': write_relationship,
+            'similarityCutoff': cutoff,
+            'topK': top_k
+        })
+
+    def louvain(self, write_property, max_levels = 10, max_iterations = 10, mutate = False):
+        mode = 'mutate' if mutate else 'write'
+        self.__run('louvain', mode, {
+            f'{mode}Property': write_property,
+            'maxLevels': max_levels,
+            'maxIterations': max_iterations
+        })
+
+    def write_node_properties(self, node_properties):
+        """
+        Method which writes back the mutated node properties
+        of the projection to the database, all at once.
+        """
+        self.database.execute(
+            'CALL gds.graph.writeNodeProperties($graph_name, $node_properties)', 'w',
+            {'graph_name': self.graph_name, 'node_properties': node_properties}
         )
-        GraphAlgos.database.execute(f'CALL gds.louvain.write({setup})', 'w')
 
     # These methods enable the use of this class in a with statement.
     def __enter__(self):
+        self.__check_memory(self.estimate_projection())
+        if self.space_id is not None:
+            self.database.execute(
+                f'CALL {GraphAlgos.projection(self.database)}.cypher($graph_name, $node_query, $rel_query, '
+                '{parameters: {space_id: $space_id}})', 'w',
+                {'graph_name': self.graph_name, 'node_query': self.node_query,
+                 'rel_query': self.rel_query, 'space_id': self.space_id}
+            )
+        else:
+            self.database.execute(
+                f'CALL {GraphAlgos.projection(self.database)}($graph_name, $nodes, $rels)', 'w',
+                {'graph_name': self.graph_name, 'nodes': self.node_projection, 'rels': self.rel_projection}
+            )
         return self
 
     # Automatic cleanup of the created graph of this class.
     def __exit__(self, exc_type, exc_value, tb):
-        if exc_type is not None:
-            traceback.print_exception(exc_type, exc_value, tb)
+        self.database.execute(
+            'CALL gds.graph.drop($graph_name, false) YIELD graphName RETURN graphName', 'w',
+            {'graph_name': self.graph_name}
+        )
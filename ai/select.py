@@ -1,71 +1,66 @@
-from ai.utils import detect_language
+from ai.utils import (
+    detect_language, detect_languages
+)
 from ai.summarization import (
-    run_textrank, keyword_extraction, text_summarization
+    run_textrank, summarize_batch,
+    keyword_extraction, text_summarization
 )
 
 
-def extract_id_texts_from_communities(database):
+def extract_id_texts_from_communities(database, space_id = None):
     """
     Function that extracts all texts from each,
     joins them, and returns them, in a dictionary,
     which use the community id as a key, and an array of
     ids of all nodes, alongside the joined text as a value.
+    If a space_id is given, only its workspace is read.
     """
+    space_filter = 'AND n.SpaceId = $space_id ' if space_id is not None else ''
     query = (
         'MATCH (n:Node)-[:is_similar]-() WHERE EXISTS(n.community) '
+        f'{space_filter}'
         'RETURN n.community, n.Position, COLLECT(DISTINCT n.id), COLLECT(DISTINCT n.DiscussionText)'
     )
-    id_texts = database.execute(query, 'r')
     return {
         community: (position, ids, ' '.join(text for text in texts).replace('\n', ' '))
-        for community, position, ids, texts in id_texts
-    } if id_texts else {}
+        for community, position, ids, texts in database.stream(query, {'space_id': space_id})
+    }
 
 
-def summarize_communities(database, en_nlp, el_nlp, lang_det, top_n, top_sent):
+def summarize_communities(communities, en_textrank, el_textrank, lang_det,
+                          n_process = 1, batch_size = 16):
     """
     Function that performs text summarization on all communities,
-    and returns their summaries.
+    as extracted by the graph backend, and returns their summaries.
+    All community texts are summarized in one batch,
+    grouped by the textrank pipeline of their language.
     """
-    communities = extract_id_texts_from_communities(database)
-
     if not communities: # if no communities exist, exit early.
         return {}
 
     results = {community: None for community in communities.keys()}
 
-    # Iterate each community id and its contents.
-    for community, (position, ids, text) in communities.items():
-
-        # If the community contains no text,
-        # or contains no more that 2 documents,
-        # then don't summarize it.
-        if text == '' or len(ids) < 2:
-            continue
-
-        # Detect the language of the text.
-        language = detect_language(lang_det, text)
-        
-        # Select the nlp object depending on language.
-        nlp = (
-            en_nlp
-            if language == 'english' 
-            else el_nlp
-        )
-
-        # Run textrank and obtain the processed document.
-        doc = run_textrank(text, nlp)
-
-        # Insert the results of both methods into the dict.
-        results[community] = [
-            position,
-            ids,
-            text_summarization(doc, nlp, top_n, top_sent)
-        ]
+    # Detect the language of all community texts at once.
+    languages = detect_languages(lang_det, [text for (_, _, text) in communities.values()])
+
+    # If the community contains no text,
+    # or contains no more that 2 documents,
+    # then don't summarize it.
+    jobs = [
+        (community, text, language)
+        for (community, (_, ids, text)), language in zip(communities.items(), languages)
+        if text != '' and len(ids) >= 2
+    ]
+
+    # Summarize all communities at once and insert the summaries into the dict.
+    summaries = summarize_batch(jobs, en_textrank, el_textrank, n_process, batch_size)
+    for community, summary in summaries.items():
+        position, ids, _ = communities[community]
+        results[community] = [position, ids, summary]
     return results
 
 
-def aggregate_summaries_keyphrases(workspace, lang_det, en_nlp, el_nlp, top_n, top_sent):
+def aggregate_summaries_keyphrases(workspace, lang_det, en_textrank, el_textrank, top_n):
     """
     Function that aggregates summaries from each workspace,
     and produces keyphrases from the aggregated summary.
@@ -87,18 +82,18 @@ def aggregate_summaries_keyphrases(workspace, lang_det, en_nlp, el_nlp, top_n, t
         # Detect the language of the aggregated summary.
         language = detect_language(lang_det, aggregated_summary)
 
-        # Select the nlp object depending on language.
+        # Select the textrank pipeline depending on language.
         nlp = (
-            en_nlp
+            en_textrank
             if language == 'english' 
-            else el_nlp
+            else el_textrank
         )
 
         # Run textrank on the aggregated summary.
-        doc = run_textrank(aggregated_summary, nlp)
+        doc = next(run_textrank([aggregated_summary], nlp))
 
         results['Aggregated'] = {
-            'Summary': text_summarization(doc, nlp, top_n, top_sent),
+            'Summary': text_summarization(doc),
             'Keyphrases': keyword_extraction(doc, nlp, language, 2 * top_n)
         }
     return results
@@ -0,0 +1,73 @@
+import os
+import uuid
+import spacy
+import logging
+import numpy as np
+from spacy.vectors import Vectors
+
+
+def vectors_path(directory, model_name):
+    """
+    Function which returns the directory of the exported
+    vectors of an installed spaCy model, which depends
+    on its version, so that upgraded models are exported again.
+    """
+    version = spacy.util.get_package_version(model_name)
+    return os.path.join(directory, f'{model_name}-{version}')
+
+
+def export_vectors(nlp, path):
+    """
+    Function which exports the vector table of a loaded pipeline
+    into .npy files, which can be memory-mapped by other processes.
+    The files are written under a temporary name and renamed,
+    so that concurrent processes never map a partial export.
+    """
+    vectors = nlp.vocab.vectors
+    os.makedirs(path, exist_ok = True)
+    suffix = f'.{uuid.uuid4().hex}.tmp'
+
+    # The rows of the table, and the key -> row index.
+    arrays = {
+        'data': np.asarray(vectors.data, dtype = np.float32),
+        'keys': np.fromiter(vectors.key2row.keys(), dtype = np.uint64, count = len(vectors.key2row)),
+        'rows': np.fromiter(vectors.key2row.values(), dtype = np.int64, count = len(vectors.key2row))
+    }
+    # Rename the data last, since its presence marks a complete export.
+    for name in ['keys', 'rows', 'data']:
+        with open(os.path.join(path, name + suffix), 'wb') as f:
+            np.save(f, arrays[name])
+        os.replace(os.path.join(path, name + suffix), os.path.join(path, f'{name}.npy'))
+    logging.info(f'Exported {vectors.shape[0]} vectors of {nlp.meta["name"]} to {path}.')
+
+
+def mapped_vectors(path, name):
+    """
+    Function which builds the spaCy vectors on top of the read-only
+    memory-mapped vector table, so that the pages are shared
+    by all processes that map it, instead of copied.
+    """
+    data = np.load(os.path.join(path, 'data.npy'), mmap_mode = 'r')
+    keys = np.load(os.path.join(path, 'keys.npy'))
+    rows = np.load(os.path.join(path, 'rows.npy'))
+    vectors = Vectors(data = data, name = name)
+    for key, row in zip(keys.tolist(), rows.tolist()):
+        vectors.add(key, row = row)
+    return vectors
+
+
+def load_shared_model(model_name, directory, exclude = ()):
+    """
+    Function which loads a spaCy model without its vectors,
+    and attaches the memory-mapped vectors, exporting them on first use.
+    """
+    path = vectors_path(directory, model_name)
+    if os.path.exists(os.path.join(path, 'data.npy')):
+        nlp = spacy.load(model_name, exclude = list(exclude) + ['vectors'])
+    else:
+        nlp = spacy.load(model_name, exclude = list(exclude))
+        export_vectors(nlp, path)
+
+    # Replace the vectors of the vocab, which the models and the documents read.
+    nlp.vocab.vectors = mapped_vectors(path, nlp.meta['vectors']['name'])
+    return nlp
@@ -1,82 +1,156 @@
-from itertools import product # Cartesian
-from spacy.tokens import Doc
-from ai.utils import (
-    detect_language, preprocess
-)
+import numpy as np
+from collections import Counter
+from ai.utils import counter
 
 
-def textual_similarity(nlp, language, source, target):
+def document_matrix(records):
     """
-    Function which compares two lists of texts
-    (source & target) of a certain language, 
-    using the associated nlp pipeline object.
+    Function which stacks the preprocessed document vectors of the
+    discussion records into a single float32 matrix, whose rows
+    are L2-normalized, so that a matrix product yields their cosine similarities.
     """
-    
-    # Apply preprocessing to all documents.
-    source_texts = [preprocess(text, nlp, language) for (_, text, language) in source]
-    target_texts = [preprocess(text, nlp, language) for (_, text, language) in target]
-
-    # Set a custom extension for documents.
-    Doc.set_extension('neo4j_id', default = -1, force = True)
-
-    # Create all document objects using the NLP pipe.
-    source_docs = list(nlp.pipe(source_texts))
-    target_docs = list(nlp.pipe(target_texts))
-
-    # Assign all ids, at their associated document objects.
-    for (i, source_doc), (j, target_doc) in zip(enumerate(source_docs), 
-                                                enumerate(target_docs)):
-        source_doc._.neo4j_id = source[i][0]
-        target_doc._.neo4j_id = source[j][0]
-    
-    # Compare all texts for similarity.
-    # For two docs list of size n, the comparison is Θ(n^2).
-    # However, this function was also build for single text comparison
-    # with a list of texts, which makes it Θ(n) in that case.
-
-    similarity_pairs = [(
-        min(element[0]._.neo4j_id, element[1]._.neo4j_id),
-        round(element[0].similarity(element[1]), 2),
-        max(element[0]._.neo4j_id, element[1]._.neo4j_id),
-        )
-        for element in product(source_docs, target_docs)
-        if element[0]._.neo4j_id != element[1]._.neo4j_id
+    matrix = np.array([record['PreprocessedVector'] for record in records], dtype = np.float32)
+    norms = np.linalg.norm(matrix, axis = 1, keepdims = True)
+
+    # Documents without a vector keep a zero row, which makes their
+    # similarity 0.0, exactly like spaCy's Doc.similarity does.
+    np.divide(matrix, norms, out = matrix, where = norms > 0)
+    return matrix
+
+
+def similarity_pairs_from_matrix(ids, matrix, cutoff, block_size = 1024):
+    """
+    Function which computes the upper triangle of the cosine similarity
+    matrix of the normalized document matrix in square blocks,
+    and returns all (min_id, score, max_id) pairs above the cutoff.
+    Only a block_size x block_size tile is kept in memory at any time.
+    """
+    pairs, n = [], matrix.shape[0]
+
+    for row_start in range(0, n, block_size):
+        row_stop = min(row_start + block_size, n)
+        rows_block = matrix[row_start:row_stop]
+
+        # Only tiles on or above the diagonal are needed, since (a, b) == (b, a).
+        for col_start in range(row_start, n, block_size):
+            col_stop = min(col_start + block_size, n)
+
+            # Round the scores in float64, so they match the python round().
+            scores = np.round((rows_block @ matrix[col_start:col_stop].T).astype(np.float64), 2)
+            mask = scores >= cutoff
+
+            # On the diagonal tile, drop the self pairs and the lower triangle.
+            if col_start == row_start:
+                mask = np.triu(mask, k = 1)
+
+            rows, cols = np.nonzero(mask)
+            for i, j, score in zip((rows + row_start).tolist(),
+                                   (cols + col_start).tolist(),
+                                   scores[rows, cols].tolist()):
+                pairs.append((min(ids[i], ids[j]), score, max(ids[i], ids[j])))
+    return pairs
+
+
+def cap_degree(pairs, max_degree):
+    """
+    Function which keeps the strongest pairs first,
+    as long as neither of their nodes has reached max_degree edges.
+    """
+    degrees, capped_pairs = Counter(), []
+    for source, score, target in sorted(pairs, key = lambda pair: pair[1], reverse = True):
+        if degrees[source] < max_degree and degrees[target] < max_degree:
+            degrees[source] += 1
+            degrees[target] += 1
+            capped_pairs.append((source, score, target))
+    return capped_pairs
+
+
+def lsh_similarity_pairs(ids, matrix, cutoff, max_degree = 10, n_tables = 8,
+                         n_bits = 12, block_size = 1024, seed = 0):
+    """
+    Function which approximates the similarity pairs above the cutoff,
+    using random-projection locality sensitive hashing.
+    Each of the n_tables hashes every document to the signs of n_bits
+    random hyperplanes, so only documents sharing a bucket are compared.
+    The degree of each node is capped to max_degree edges.
+    """
+    rng = np.random.default_rng(seed)
+    powers = 1 << np.arange(n_bits, dtype = np.int64)
+    candidates = {}
+
+    for _ in range(n_tables):
+        # Hash each document to the bit pattern of its hyperplane signs.
+        hyperplanes = rng.standard_normal((matrix.shape[1], n_bits)).astype(np.float32)
+        codes = ((matrix @ hyperplanes) > 0) @ powers
+
+        # Group the row indices of the documents by their bucket.
+        order = np.argsort(codes, kind = 'stable')
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+
+        # Compare exactly the documents inside each bucket only.
+        for bucket in np.split(order, boundaries):
+            if len(bucket) < 2:
+                continue
+            for i, score, j in similarity_pairs_from_matrix(
+                    bucket.tolist(), matrix[bucket], cutoff, block_size):
+                candidates[(i, j)] = score
+
+    pairs = [
+        (min(ids[i], ids[j]), score, max(ids[i], ids[j]))
+        for (i, j), score in candidates.items()
     ]
+    return cap_degree(pairs, max_degree)
+
 
-    # Return unique non-duplicate pairs.
-    return list(set(similarity_pairs))
+def textual_similarity(records, cutoff, block_size = 1024,
+                       ann_threshold = None, max_degree = 10):
+    """
+    Function which compares all discussion records of a certain language
+    with each other, and returns the similarity pairs above the cutoff.
+    Lists of at least ann_threshold records use the approximate index.
+    """
+    # Stack all preprocessed document vectors into a normalized matrix.
+    matrix = document_matrix(records)
+    ids = [record['id'] for record in records]
+
+    # Large lists would not fit an n x n comparison; use the LSH index.
+    if ann_threshold is not None and len(records) >= ann_threshold:
+        return lsh_similarity_pairs(
+            ids, matrix, cutoff, max_degree, block_size = block_size
+        )
 
+    # Compare all texts for similarity, on the upper triangle only.
+    # For a list of size n, the comparison is still Θ(n^2),
+    # but it runs as a few matrix products instead of n^2 python calls.
+    return similarity_pairs_from_matrix(ids, matrix, cutoff, block_size)
 
-def calc_similarity_pairs(text_ids, en_nlp, el_nlp, lang_det, cutoff):
+
+@counter
+def calc_similarity_pairs(records, cutoff, block_size = 1024,
+                          ann_threshold = None, max_degree = 10):
     """
-    This function splits the list of texts into greek and english,
-    then calculates the similarity pairs for each language, if possible.
+    This function splits the discussion records into greek and english,
+    using their extracted features, then calculates
+    the similarity pairs for each language, if possible.
     """
 
     # Not enough texts to compare; return early.
-    if len(text_ids) < 2:
+    if len(records) < 2:
         return []
 
-    # Detect the language for each text and assign it.
-    texts = [(id, text, detect_language(lang_det, text)) for (id, text) in text_ids]
-
-    # Split the texts between english and greek.
-    en_texts = [text for text in texts if text[2] == 'english']
-    el_texts = [text for text in texts if text[2] == 'greek']
+    # Split the records between english and greek.
+    en_records = [record for record in records if record['Language'] == 'english']
+    el_records = [record for record in records if record['Language'] == 'greek']
 
-    # Calculate all textual similarity pairs.
+    # Calculate all textual similarity pairs above the cutoff.
     sim_pairs_en = (
-        textual_similarity(en_nlp, 'english', en_texts, en_texts)
-        if len(en_texts) >= 2 else []
+        textual_similarity(en_records, cutoff, block_size, ann_threshold, max_degree)
+        if len(en_records) >= 2 else []
     )
 
     sim_pairs_el = (
-        textual_similarity(el_nlp, 'greek', el_texts, el_texts) 
-        if len(el_texts) >= 2 else []
+        textual_similarity(el_records, cutoff, block_size, ann_threshold, max_degree)
+        if len(el_records) >= 2 else []
     )
-    
-    return [
-        sim_pair 
-        for sim_pair in sim_pairs_en + sim_pairs_el
-        if sim_pair[1] >= cutoff
-    ]
+
+    return sim_pairs_en + sim_pairs_el
@@ -1,23 +1,91 @@
+import spacy
 import pytextrank
+from spacy.language import Language
+from spacy.tokens import Doc
 import ai.utils
 
 
-def run_textrank(text, nlp):
+# The textrank outputs, kept as plain strings.
+Doc.set_extension('summary', default = '', force = True)
+Doc.set_extension('keyphrases', default = [], force = True)
+
+
+class TextRankSummary:
+    """
+    Pipeline component which runs after textrank and keeps its summary
+    and ranked keyphrases as plain strings, dropping the textrank objects,
+    so that the documents can also be sent across processes by nlp.pipe.
+    """
+    def __init__(self, limit_phrases, limit_sentences):
+        self.limit_phrases = limit_phrases
+        self.limit_sentences = limit_sentences
+
+    def __call__(self, doc):
+        doc._.summary = ' '.join(sent.text
+            for sent in doc._.textrank.summary(
+                limit_phrases = self.limit_phrases,
+                limit_sentences = self.limit_sentences)
+        )
+        doc._.keyphrases = [phrase.text for phrase in doc._.phrases]
+        doc._.textrank, doc._.phrases = None, []
+        return doc
+
+
+@Language.factory('textrank_summary', default_config = {'limit_phrases': 10, 'limit_sentences': 5})
+def create_textrank_summary(nlp, name, limit_phrases, limit_sentences):
+    return TextRankSummary(limit_phrases, limit_sentences)
+
+
+def textrank_pipeline(model_name, base_nlp, top_n = 10, top_sent = 5):
     """
-    Function that calculates textrank,
-    for a single document. It serves as a basis
-    as to not rerun textrank for both functions below.
+    Function that builds a dedicated textrank pipeline of a spaCy model,
+    which shares the vocab (and vectors) of the already loaded model,
+    without loading them again, and loads only the components
+    of the textrank stage.
+    It is built once, so textrank is never added to or removed
+    from the shared pipelines, and is safe to use by many callers.
     """
-    # Temporarily add PyTextRank to the spaCy pipeline.
+    nlp = spacy.load(
+        model_name, vocab = base_nlp.vocab,
+        exclude = ai.utils.stage_disabled(base_nlp, 'textrank') + ai.utils.EXCLUDED_COMPONENTS + ['vocab']
+    )
     nlp.add_pipe('textrank', last = True)
+    nlp.add_pipe('textrank_summary', last = True, config = {
+        'limit_phrases': top_n, 'limit_sentences': top_sent
+    })
+    return nlp
 
-    # Create the document using the pipeline.
-    doc = nlp(text)
-    
-    # Remove textrank from the pipeline.
-    nlp.remove_pipe('textrank')
 
-    return doc
+def run_textrank(texts, nlp, n_process = 1, batch_size = 16):
+    """
+    Function that runs textrank on a batch of texts,
+    using a textrank pipeline, and yields their documents.
+    """
+    return nlp.pipe(texts, n_process = n_process, batch_size = batch_size)
+
+
+def summarize_batch(jobs, en_textrank, el_textrank, n_process = 1, batch_size = 16):
+    """
+    Function that summarizes a batch of (key, text, language) jobs,
+    e.g. all communities or clusters of a workspace. The jobs are grouped
+    by language and each group is streamed through its textrank pipeline,
+    and the summaries are returned keyed by the key of their job.
+    """
+    # Group the jobs by language; unsupported languages use the greek pipeline.
+    groups = {'english': [], 'greek': []}
+    for key, text, language in jobs:
+        groups['english' if language == 'english' else 'greek'].append((key, text))
+
+    summaries = {}
+    for language, textrank in [('english', en_textrank), ('greek', el_textrank)]:
+        if not groups[language]:
+            continue
+        docs = run_textrank(
+            (text for (_, text) in groups[language]), textrank, n_process, batch_size
+        )
+        for (key, _), doc in zip(groups[language], docs):
+            summaries[key] = text_summarization(doc)
+    return summaries
 
 
 def keyword_extraction(doc, nlp, language, top_n = 10, 
@@ -31,8 +99,8 @@ def keyword_extraction(doc, nlp, language, top_n = 10,
 
     # Extract the top N phrases from the document.
     keyphrases = [
-        phrase.text for phrase in doc._.phrases 
-        if phrase.text.lower() not in nlp.Defaults.stop_words
+        phrase for phrase in doc._.keyphrases
+        if phrase.lower() not in nlp.Defaults.stop_words
     ][:top_n]
 
     # Remove punctuation and unnecessary whitespace from the keyphrases.
@@ -46,18 +114,10 @@ def keyword_extraction(doc, nlp, language, top_n = 10,
     return keyphrases
 
 
-def text_summarization(doc, nlp, top_n = 15, top_sent = 5):
+def text_summarization(doc):
     """
-    Function that extracts the top_sent most significant
+    Function that returns the top most significant
     sentences, using textrank. The algorithm is implemented
     as a highly performant spacy pipeline component.
     """
-
-    # Access the textrank component to perform summarization.
-    summary = ' '.join(sent.text
-        for sent in doc._.textrank.summary(
-            limit_phrases = top_n, 
-            limit_sentences = top_sent)
-    )
-
-    return summary
+    return doc._.summary
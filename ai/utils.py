@@ -1,60 +1,203 @@
+import re
 import sys
 import time
 import html
+import hashlib
 import string
 import spacy
 import fasttext
 import logging
 import datetime
 import functools
-import requests
+import threading
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 from decouple import config
 import ai.config
+import ai.summarization
+import ai.shared_vectors
 
 
 ERGOLOGIC_WORKSPACES_URL = config('ERGOLOGIC_WORKSPACES_URL')
 ERGOLOGIC_DISCUSSIONS_URL = config('ERGOLOGIC_DISCUSSIONS_URL')
 
+# The pipeline components each stage of the ML pipeline needs.
+# The vectors stage only needs the tokenizer and the static vectors,
+# the tagging stage only needs the part-of-speech tags,
+# and textrank also needs the parser (noun chunks) and the lemmas.
+# No stage needs the named entities, so NER is never loaded.
+TAGGING_COMPONENTS = ['tok2vec', 'tagger', 'morphologizer', 'attribute_ruler']
+STAGE_COMPONENTS = {
+    'vectors': [],
+    'tagging': TAGGING_COMPONENTS,
+    'textrank': TAGGING_COMPONENTS + ['parser', 'lemmatizer']
+}
+EXCLUDED_COMPONENTS = ['ner']
+
+
+def load_spacy_model(model_name):
+    """
+    Function which loads a spaCy model without the unused components,
+    with its vectors memory-mapped from the shared vectors directory,
+    so that all processes share a single copy of the vector table.
+    """
+    if ai.config.shared_vectors:
+        return ai.shared_vectors.load_shared_model(
+            model_name, ai.config.shared_vectors_dir, EXCLUDED_COMPONENTS
+        )
+    return spacy.load(model_name, exclude = EXCLUDED_COMPONENTS)
+
 
 class Models:
-    __en_nlp = None
-    __el_nlp = None
-    __lang_det = None
+    """
+    Class which loads each pre-trained model lazily, on first use,
+    and keeps it for the lifetime of the process.
+    Independent models are loaded in parallel threads,
+    since loading them is mostly I/O and deserialization.
+    """
+    __loaders = {
+        'english': lambda: load_spacy_model('en_core_web_lg'),
+        'greek': lambda: load_spacy_model('el_core_news_lg'),
+        'language_detection': lambda: fasttext.load_model('/downloads/lid.176.bin')
+    }
+    __models = {}
+    __locks = {name: threading.Lock() for name in __loaders}
+    __en_textrank = None
+    __el_textrank = None
+    __textrank_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, name):
+        """
+        Class method which returns a model by its name,
+        ('english', 'greek' or 'language_detection'),
+        loading it and logging its load duration on first use.
+        """
+        if name not in cls.__models:
+            with cls.__locks[name]:
+                if name not in cls.__models:
+                    start = time.perf_counter()
+                    cls.__models[name] = cls.__loaders[name]()
+                    logging.info(f'Loaded the {name} model in {time.perf_counter() - start:.1f} secs.')
+        return cls.__models[name]
 
     @classmethod
     def load_models(cls):
         """
         Class method which loads the english & greek
-        NLP models, as well as the language detection model.
-        This needs to run once since all models need a few seconds to load.
+        NLP models, as well as the language detection model,
+        in parallel, so loading takes as long as the slowest model.
+        Models which are already loaded are returned at once.
+        """
+        names = ['english', 'greek', 'language_detection']
+        if any(name not in cls.__models for name in names):
+            logging.info('Loading pre-trained ML models...')
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers = len(names)) as executor:
+                list(executor.map(cls.get, names))
+            logging.info(f'Loaded pre-trained ML models in {time.perf_counter() - start:.1f} secs.')
+
+        return tuple(cls.__models[name] for name in names)
+
+    @classmethod
+    def textrank_pipelines(cls):
+        """
+        Class method which builds the english & greek textrank pipelines
+        once, sharing the vocab of the loaded NLP models, and returns them.
         """
-        logging.info('Loading pre-trained ML models...')
-        if cls.__en_nlp is None:
-            cls.__en_nlp = spacy.load('en_core_web_lg')
-            cls.__el_nlp = spacy.load('el_core_news_lg')
-            cls.__lang_det = fasttext.load_model('/downloads/lid.176.bin')
+        with cls.__textrank_lock:
+            if cls.__en_textrank is None:
+                en_nlp, el_nlp = cls.get('english'), cls.get('greek')
+                cls.__en_textrank = ai.summarization.textrank_pipeline(
+                    'en_core_web_lg', en_nlp, ai.config.top_n, ai.config.top_sent
+                )
+                cls.__el_textrank = ai.summarization.textrank_pipeline(
+                    'el_core_news_lg', el_nlp, ai.config.top_n, ai.config.top_sent
+                )
 
         return (
-            cls.__en_nlp,
-            cls.__el_nlp,
-            cls.__lang_det
+            cls.__en_textrank,
+            cls.__el_textrank
         )
 
 
+def stage_disabled(nlp, stage):
+    """
+    Function which returns the components of the pipeline,
+    which are not needed by the given stage.
+    """
+    return [name for name in nlp.pipe_names if name not in STAGE_COMPONENTS[stage]]
+
+
+def pipe_stage(nlp, stage, texts, batch_size = 1000):
+    """
+    Function which processes the texts using only the pipeline
+    components of the given stage, without modifying the shared
+    pipeline, and returns their documents. When the stage
+    needs no components, only the tokenizer runs.
+    """
+    disabled = stage_disabled(nlp, stage)
+    if len(disabled) == len(nlp.pipe_names):
+        return nlp.tokenizer.pipe(texts, batch_size = batch_size)
+    return nlp.pipe(texts, disable = disabled, batch_size = batch_size)
+
+
+def language_from_label(label, text):
+    """
+    Function which maps a fasttext label to a supported language.
+    """
+    if label == '__label__en':
+        return 'english'
+    elif label == '__label__el':
+        return 'greek'
+    elif ai.config.debug:
+        print(f'{text} -> Unsupported language {label}', file = sys.stderr)
+
+
 def detect_language(model, text):
     """
     Function that detects the language of a given text,
     using the fasttext algorithm.
     """
     language = model.predict(text, k = 1)[0][0]  # Top 1 matching language.
-    
-    if language == '__label__en':
-        return 'english'
-    elif language == '__label__el':
-        return 'greek'
-    elif ai.config.debug:
-        print(f'{text} -> Unsupported language {language}', file = sys.stderr)
+    return language_from_label(language, text)
+
+
+# Memo of detected languages, keyed by the hash of each text.
+language_memo = {}
+
+
+def detect_languages(model, texts, memoize = True):
+    """
+    Function that detects the languages of a list of texts,
+    using a single fasttext call for all of them.
+    Since fasttext rejects newlines, these are replaced by spaces.
+    Memoized texts are not passed to the model again.
+    """
+    keys = [hashlib.sha1(text.encode('utf-8')).hexdigest() for text in texts]
+    languages = {
+        key: language_memo[key] for key in keys
+        if memoize and key in language_memo
+    }
+    missing = {
+        key: text for key, text in zip(keys, texts)
+        if key not in languages
+    }
+
+    if missing:
+        labels, _ = model.predict(
+            [text.replace('\n', ' ') for text in missing.values()], k = 1
+        )
+        for (key, text), label in zip(missing.items(), labels):
+            languages[key] = language_from_label(label[0], text)
+
+        if memoize:
+            # Keep the memo bounded, by starting over when it grows too large.
+            if len(language_memo) + len(missing) > ai.config.language_memo_size:
+                language_memo.clear()
+            language_memo.update({key: languages[key] for key in missing})
+
+    return [languages[key] for key in keys]
 
 
 def remove_greek_accents(text):
@@ -66,11 +209,62 @@ def remove_greek_accents(text):
     return ''.join(c if c not in gr_accents else gr_accents[c] for c in text)
 
 
+# The tags of simple markup, whose text can be extracted without a parse tree.
+SIMPLE_TAGS = {
+    'a', 'abbr', 'b', 'blockquote', 'br', 'code', 'div', 'em', 'font', 'h1', 'h2', 'h3',
+    'h4', 'h5', 'h6', 'hr', 'i', 'li', 'ol', 'p', 'pre', 's', 'small', 'span', 'strike',
+    'strong', 'sub', 'sup', 'u', 'ul'
+}
+SIMPLE_TAG_PATTERN = re.compile(
+    r'</?([a-zA-Z][a-zA-Z0-9]*)'
+    r'(?:\s+[\w:.-]+(?:\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s"\'<>=`]+))?)*'
+    r'\s*/?>'
+)
+CHARACTER_REFERENCE_PATTERN = re.compile(r'&[#a-zA-Z]')
+
+
+def remove_html_soup(text):
+    """
+    Function which strips HTML tags and unescapes HTML symbols from text,
+    using a full BeautifulSoup parse tree, for any kind of HTML.
+    """
+    return BeautifulSoup(html.unescape(text), features = 'html.parser').get_text(strip = True)
+
+
+def remove_simple_html(text):
+    """
+    Function which strips the tags of simple markup, producing the same
+    text as BeautifulSoup: the stripped text between the tags,
+    joined without a separator. Returns None if the text contains
+    anything else, e.g. comments, scripts, malformed tags or
+    character references, which BeautifulSoup resolves on its own.
+    """
+    if CHARACTER_REFERENCE_PATTERN.search(text):
+        return None
+
+    pieces, position = [], 0
+    for match in SIMPLE_TAG_PATTERN.finditer(text):
+        if match.group(1).lower() not in SIMPLE_TAGS:
+            return None
+        pieces.append(text[position:match.start()])
+        position = match.end()
+    pieces.append(text[position:])
+
+    # Any other '<' may start markup which needs the full parser.
+    if any('<' in piece for piece in pieces):
+        return None
+    return ''.join(piece.strip() for piece in pieces)
+
+
+@functools.lru_cache(maxsize = ai.config.html_memo_size)
 def remove_html(text):
     """
     Function which strips HTML tags and unescapes HTML symbols from text.
+    Plain texts and simple markup take a fast path, and only complex HTML
+    is parsed by BeautifulSoup. Repeated texts are memoized.
     """
-    return BeautifulSoup(html.unescape(text), features = 'html.parser').get_text(strip = True)
+    stripped = remove_simple_html(html.unescape(text))
+    return stripped if stripped is not None else remove_html_soup(text)
 
 
 def remove_punctuation_and_whitespace(text):
@@ -90,18 +284,26 @@ def preprocess(text, nlp, language):
     pronouns and punctuation from the text.
     """
     # Create the document from the lowercased text.
-    doc = list(nlp.pipe([text], disable = ['parser', 'ner', 'textcat']))
+    doc = list(pipe_stage(nlp, 'tagging', [text]))
+    return preprocess_doc(doc[0], nlp, language)
+
 
+def preprocess_doc(doc, nlp, language):
+    """
+    Function which removes all stopwords, pronouns and punctuation
+    from an already tagged document, so that many documents
+    can be created at once, using a single nlp.pipe call.
+    """
     # Isolate the useful tokens and join them using a single space.
     if language == 'english':
         return ' '.join(
-            token.text.lower() for token in doc[0]
+            token.text.lower() for token in doc
             if token.text not in nlp.Defaults.stop_words
             and token.pos_ in ['NOUN', 'PROPN'] and not token.is_punct
         )
     elif language == 'greek':
         return ' '.join(
-            remove_greek_accents(token.text.lower()) for token in doc[0]
+            remove_greek_accents(token.text.lower()) for token in doc
             if token.text not in nlp.Defaults.stop_words
             and token.pos_ in ['NOUN', 'PROPN'] and not token.is_punct
         )
@@ -163,46 +365,35 @@ def counter(func):
     return wrapper_counter
 
 
-def get_data_from_ergologic():
+def wait_until_ready(name, probe, timeout = 300, max_delay = 10):
     """
-    Function which GETs data from the Ergologic backend.
+    Function which calls the probe of a service until it succeeds,
+    sleeping with exponential backoff between the failed attempts,
+    and raises a TimeoutError if it is not ready within the timeout.
     """
-    got_responses = True
-    workspaces_url = ERGOLOGIC_WORKSPACES_URL
-    discussions_url = ERGOLOGIC_DISCUSSIONS_URL
+    start, delay = time.perf_counter(), 0.5
+    while True:
+        try:
+            probe()
+            logging.info(f'{name} is ready after {time.perf_counter() - start:.1f} secs.')
+            return
+        except Exception as e:
+            elapsed = time.perf_counter() - start
+            if elapsed + delay > timeout:
+                raise TimeoutError(f'{name} is not ready after {elapsed:.1f} secs: {e}')
+            logging.info(f'Waiting for {name}: {e}')
+            time.sleep(delay)
+            delay = min(2 * delay, max_delay)
 
-    response = requests.get(workspaces_url)
-    if response.status_code == 200:
-        workspaces_json = response.json()
-    else:
-        got_responses = False
-        logging.error(f'The Ergologic backend workspaces url {workspaces_url} was not found!')
 
-    response = requests.get(discussions_url)
-    if response.status_code == 200:
-        discussions_json = response.json()
-    else:
-        got_responses = False
-        logging.error(f'The Ergologic backend discussions url {discussions_url} was not found!')
-
-    # If we did not receive all respones, early return.
-    if not got_responses:
-        return
-
-    workspaces = [
-        {'id': wsp['id'],
-         'OwnerId': wsp['OwnerId'],
-         'Description': remove_html(wsp['Description']),
-         'Summary': remove_html(wsp['Summary'])
-        } for wsp in workspaces_json
-    ]
-
-    discussions = [
-        {'id': wsp['id'],
-         'SpaceId': wsp['SpaceId'],
-         'UserId': wsp['UserId'],
-         'Position': ai.config.position_number_to_string.get(wsp['Position'], 'Issue'),
-         'DiscussionText': remove_html(wsp['DiscussionText'])
-        } for wsp in discussions_json
-    ]
-    return (workspaces, discussions)
+def workspace_fingerprint(discussions):
+    """
+    Function which hashes the ids, positions and texts
+    of all discussions of a workspace, so that
+    unchanged workspaces can be detected across runs.
+    """
+    digest = hashlib.sha1()
+    for discussion in sorted(discussions, key = lambda discussion: discussion['id']):
+        text_hash = hashlib.sha1(discussion['DiscussionText'].encode('utf-8')).hexdigest()
+        digest.update(f'{discussion["id"]}|{discussion["Position"]}|{text_hash}\n'.encode('utf-8'))
+    return digest.hexdigest()
@@ -0,0 +1,62 @@
+import random
+import argparse
+import requests
+from timeit import default_timer
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(latencies, fraction):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def client(url, workspace_ids, requests_per_client, per_request, fields, etag, seed):
+    """
+    A polling client, which requests random sets of workspaces,
+    and returns the latency of each request.
+    """
+    rng, session, latencies = random.Random(seed), requests.Session(), []
+    for _ in range(requests_per_client):
+        params = [('q', id) for id in rng.sample(workspace_ids, min(per_request, len(workspace_ids)))]
+        params += [('fields', field) for field in fields]
+        headers = {}
+        start = default_timer()
+        response = session.get(url, params = params, headers = headers)
+        if etag and response.status_code == 200:
+            # Poll again with the ETag, as a frontend would.
+            headers['If-None-Match'] = response.headers.get('ETag', '')
+            response = session.get(url, params = params, headers = headers)
+        response.raise_for_status()
+        latencies.append(default_timer() - start)
+    return latencies
+
+
+def main(url, workspace_ids, clients, requests_per_client, per_request, fields, etag):
+    start = default_timer()
+    with ThreadPoolExecutor(max_workers = clients) as executor:
+        results = executor.map(
+            lambda seed: client(url, workspace_ids, requests_per_client, per_request, fields, etag, seed),
+            range(clients)
+        )
+        latencies = [latency for result in results for latency in result]
+    seconds = default_timer() - start
+    print(
+        f'{len(latencies)} requests in {seconds:.1f} secs ({len(latencies) / seconds:.0f} req/sec), '
+        f'p50 {1000 * percentile(latencies, 0.5):.1f} ms, '
+        f'p99 {1000 * percentile(latencies, 0.99):.1f} ms'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description = 'Load test /get-analysis. Run it before and after a change, to compare its latency.'
+    )
+    parser.add_argument('--url', default = 'http://localhost:8000/get-analysis')
+    parser.add_argument('--workspaces', type = int, nargs = '+', required = True)
+    parser.add_argument('--clients', type = int, default = 20)
+    parser.add_argument('--requests', type = int, default = 200, help = 'Requests per client.')
+    parser.add_argument('--per-request', type = int, default = 5, help = 'Workspaces per request.')
+    parser.add_argument('--fields', nargs = '*', default = [])
+    parser.add_argument('--etag', action = 'store_true', help = 'Revalidate each response with If-None-Match.')
+    args = parser.parse_args()
+    main(args.url, args.workspaces, args.clients, args.requests, args.per_request, args.fields, args.etag)
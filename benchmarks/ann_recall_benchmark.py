@@ -0,0 +1,62 @@
+import argparse
+import numpy as np
+from timeit import default_timer
+import ai.config
+from ai.similarity import (
+    cap_degree, lsh_similarity_pairs, similarity_pairs_from_matrix
+)
+
+
+def synthetic_matrix(size, dim = 300, n_topics = 50, noise = 0.6, seed = 0):
+    """
+    Function which generates normalized document vectors,
+    scattered around a number of topic centers, like real arguments are.
+    """
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((n_topics, dim))
+    matrix = topics[rng.integers(0, n_topics, size)] + noise * rng.standard_normal((size, dim))
+    matrix /= np.linalg.norm(matrix, axis = 1, keepdims = True)
+    return matrix.astype(np.float32)
+
+
+def recall(approximate, exact):
+    exact_edges = {(source, target) for source, _, target in exact}
+    approximate_edges = {(source, target) for source, _, target in approximate}
+    return len(exact_edges & approximate_edges) / len(exact_edges) if exact_edges else 1.0
+
+
+def main(sizes, cutoff, max_degree, n_tables, n_bits):
+    print(
+        f'{"texts":>8} {"exact (s)":>10} {"lsh (s)":>10} {"exact":>9} {"capped":>8} '
+        f'{"lsh":>8} {"recall":>7} {"recall@cap":>11}'
+    )
+    for size in sizes:
+        matrix = synthetic_matrix(size)
+        ids = list(range(size))
+
+        start = default_timer()
+        exact = similarity_pairs_from_matrix(ids, matrix, cutoff, ai.config.similarity_block_size)
+        exact_secs = default_timer() - start
+
+        start = default_timer()
+        approximate = lsh_similarity_pairs(ids, matrix, cutoff, max_degree, n_tables, n_bits)
+        lsh_secs = default_timer() - start
+
+        # The index caps the degree, so compare against the capped exact graph too.
+        capped = cap_degree(exact, max_degree)
+        print(
+            f'{size:>8} {exact_secs:>10.3f} {lsh_secs:>10.3f} {len(exact):>9} {len(capped):>8} '
+            f'{len(approximate):>8} {recall(approximate, exact):>7.3f} '
+            f'{recall(approximate, capped):>11.3f}'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Report the recall of the LSH index against the exact path.')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [1000, 5000, 10000, 20000])
+    parser.add_argument('--cutoff', type = float, default = ai.config.cutoff)
+    parser.add_argument('--max-degree', type = int, default = ai.config.ann_max_degree)
+    parser.add_argument('--tables', type = int, default = 8)
+    parser.add_argument('--bits', type = int, default = 12)
+    args = parser.parse_args()
+    main(args.sizes, args.cutoff, args.max_degree, args.tables, args.bits)
@@ -0,0 +1,109 @@
+import asyncio
+import argparse
+from timeit import default_timer
+from bson.objectid import ObjectId
+from pymongo import monitoring
+
+
+class RoundTrips(monitoring.CommandListener):
+    """
+    Command listener which counts the commands sent to MongoDB.
+    """
+    count = 0
+
+    def started(self, event):
+        RoundTrips.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# The listener must be registered before the clients of the database modules are created.
+monitoring.register(RoundTrips())
+
+from server.database.discourse_items_database import discourse_items_collection, discourse_item_from_database
+from server.database.discourse_items_links_database import (discourse_items_links_collection,
+                                                            discourse_items_link_from_database)
+from server.database.discourses_database import discourses_collection, discourses_from_database
+
+
+async def legacy_discourse_from_database(discourse, client='frontend'):
+    """
+    The one query per item & link assembly, kept as the baseline.
+    """
+    discourse_items_data = []
+    for id in discourse['discourseItems']:
+        discourse_item = await discourse_items_collection.find_one({'_id': id})
+        discourse_items_data.append(discourse_item_from_database(discourse_item, client))
+    discourse_items_links_data = []
+    for id in discourse['discourseItemsLinks']:
+        discourse_items_link = await discourse_items_links_collection.find_one({'_id': id})
+        discourse_items_links_data.append(discourse_items_link_from_database(discourse_items_link, client))
+    return {'id': str(discourse['_id']), 'data': discourse_items_data + discourse_items_links_data}
+
+
+async def seed(discourses, items_per_discourse):
+    """
+    Insert synthetic discourses, with chains of linked items.
+    """
+    seeded = []
+    for _ in range(discourses):
+        items = [{
+            '_id': ObjectId(), 'label': 'Benchmark label', 'type': 'issue', 'text': 'Benchmark text',
+            'authorId': ObjectId(), 'likes': 0, 'dislikes': 0
+        } for _ in range(items_per_discourse)]
+        links = [{
+            '_id': ObjectId(), 'sourceId': source['_id'], 'targetId': target['_id'], 'type': 'supports'
+        } for source, target in zip(items, items[1:])]
+        await discourse_items_collection.insert_many(items)
+        await discourse_items_links_collection.insert_many(links)
+        discourse = {
+            '_id': ObjectId(),
+            'discourseItems': [item['_id'] for item in items],
+            'discourseItemsLinks': [link['_id'] for link in links]
+        }
+        await discourses_collection.insert_one(discourse)
+        seeded.append(discourse)
+    return seeded
+
+
+async def cleanup(discourses):
+    await discourse_items_collection.delete_many(
+        {'_id': {'$in': [id for discourse in discourses for id in discourse['discourseItems']]}})
+    await discourse_items_links_collection.delete_many(
+        {'_id': {'$in': [id for discourse in discourses for id in discourse['discourseItemsLinks']]}})
+    await discourses_collection.delete_many({'_id': {'$in': [discourse['_id'] for discourse in discourses]}})
+
+
+async def measure(assemble, discourses):
+    RoundTrips.count, start = 0, default_timer()
+    results = await assemble(discourses)
+    return results, RoundTrips.count, default_timer() - start
+
+
+async def legacy(discourses):
+    return [await legacy_discourse_from_database(discourse) for discourse in discourses]
+
+
+async def main(discourses, items_per_discourse):
+    seeded = await seed(discourses, items_per_discourse)
+    try:
+        legacy_results, legacy_trips, legacy_secs = await measure(legacy, seeded)
+        batched_results, batched_trips, batched_secs = await measure(discourses_from_database, seeded)
+        print(f'{"assembly":>9} {"round-trips":>12} {"seconds":>9}')
+        print(f'{"legacy":>9} {legacy_trips:>12} {legacy_secs:>9.3f}')
+        print(f'{"batched":>9} {batched_trips:>12} {batched_secs:>9.3f}')
+        print(f'Same discourses, in the same order: {legacy_results == batched_results}')
+    finally:
+        await cleanup(seeded)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the assembly of discourses.')
+    parser.add_argument('--discourses', type=int, default=20)
+    parser.add_argument('--items', type=int, default=500, help='Items per discourse.')
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(main(args.discourses, args.items))
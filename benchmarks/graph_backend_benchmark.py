@@ -0,0 +1,51 @@
+import argparse
+import numpy as np
+import scipy.sparse as sp
+from timeit import default_timer
+from ai.graph_backend import louvain_communities
+
+
+def planted_partition(n_nodes, n_communities, p_in, p_out, seed = 0):
+    """
+    Function which generates a symmetric adjacency matrix
+    with n_communities planted communities of equal size.
+    """
+    rng = np.random.default_rng(seed)
+    planted = rng.integers(0, n_communities, n_nodes)
+    sources, targets = np.triu_indices(n_nodes, k = 1)
+    probabilities = np.where(planted[sources] == planted[targets], p_in, p_out)
+    keep = rng.random(len(sources)) < probabilities
+    adjacency = sp.coo_matrix(
+        (np.ones(keep.sum()), (sources[keep], targets[keep])), shape = (n_nodes, n_nodes)
+    ).tocsr()
+    return adjacency + adjacency.T, planted
+
+
+def modularity(adjacency, membership):
+    degrees = np.asarray(adjacency.sum(axis = 1)).ravel()
+    total_weight = degrees.sum()
+    sources, targets = adjacency.nonzero()
+    internal = adjacency[sources, targets].A1[membership[sources] == membership[targets]].sum()
+    community_degrees = np.bincount(membership, weights = degrees)
+    return internal / total_weight - ((community_degrees / total_weight) ** 2).sum()
+
+
+def main(sizes, n_communities):
+    print(f'{"nodes":>8} {"edges":>9} {"secs":>8} {"found":>6} {"modularity":>11} {"planted":>8}')
+    for size in sizes:
+        adjacency, planted = planted_partition(size, n_communities, 20 / size * n_communities, 1 / size, seed = size)
+        start = default_timer()
+        membership = louvain_communities(adjacency)
+        secs = default_timer() - start
+        print(
+            f'{size:>8} {adjacency.nnz // 2:>9} {secs:>8.3f} {len(np.unique(membership)):>6} '
+            f'{modularity(adjacency, membership):>11.3f} {modularity(adjacency, planted):>8.3f}'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the in-process Louvain community detection.')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [500, 2000, 5000])
+    parser.add_argument('--communities', type = int, default = 20)
+    args = parser.parse_args()
+    main(args.sizes, args.communities)
@@ -0,0 +1,116 @@
+import random
+import argparse
+from timeit import default_timer
+import ai.config
+from ai.neo4j_wrapper import Neo4jDatabase
+from ai.create import (
+    create_constraints,
+    create_discussion_nodes,
+    delete_workspace_graph
+)
+
+
+# A SpaceId which no real workspace uses, so the benchmark graph is isolated.
+BENCHMARK_SPACE_ID = -1
+
+
+def synthetic_graph(n_nodes, n_edges, seed = 0):
+    """
+    Function which generates the node group & similarity edges of a fake workspace.
+    The texts contain single quotes, which the string-built queries cannot handle.
+    """
+    rng = random.Random(seed)
+    nodes = [
+        {'UserId': rng.randint(1, 100), 'id': 10**9 + i, 'SpaceId': BENCHMARK_SPACE_ID,
+         'Position': 'Note', 'DiscussionText': f"argument {i}: it's a citizen's view"}
+        for i in range(n_nodes)
+    ]
+    edges = [
+        sorted(rng.sample(range(10**9, 10**9 + n_nodes), 2))
+        for _ in range(n_edges)
+    ]
+    return {'Note': nodes}, [[source, round(rng.random(), 2), target] for source, target in edges]
+
+
+def legacy_create_discussion_nodes(database, node_groups):
+    """
+    The string concatenation implementation, kept as the baseline.
+    Single quotes are escaped here, which the original did not do.
+    """
+    for label, nodes in node_groups.items():
+        if nodes:
+            string_builder, single_quote = '[', '\''
+            for node in nodes:
+                item = ', '.join(
+                    f'{k}: {v if type(v) == int else single_quote + v.replace(single_quote, chr(92) + single_quote) + single_quote}'
+                    for k, v in node.items()
+                )
+                string_builder += f'{{{item}}}, '
+            list_of_dicts = string_builder[:-2] + ']'
+            query = (
+                f'UNWIND {list_of_dicts} AS node '
+                f'MERGE (n:Node {{UserId: node.UserId, id: node.id, '
+                f'SpaceId: node.SpaceId, Position: node.Position, '
+                f'DiscussionText: node.DiscussionText}})'
+            )
+            database.execute(query, 'w')
+
+
+def legacy_create_edges(database, edges):
+    query = (
+        f'UNWIND {edges} as row '
+        'MATCH (s:Node {id: row[0]}), (t:Node{id: row[2]}) '
+        'MERGE (s)-[r:is_similar]-(t) '
+        'SET r.score = row[1]'
+    )
+    database.execute(query, 'w')
+
+
+def create_edges(database, edges, batch_size):
+    query = (
+        'UNWIND $rows AS row '
+        'MATCH (s:Node {id: row[0]}), (t:Node {id: row[2]}) '
+        'WHERE s.SpaceId = $space_id AND t.SpaceId = $space_id '
+        'MERGE (s)-[r:is_similar]-(t) '
+        'SET r.score = row[1]'
+    )
+    database.write_in_batches(query, edges, batch_size, {'space_id': BENCHMARK_SPACE_ID})
+
+
+def timed(func, *args):
+    start = default_timer()
+    func(*args)
+    return default_timer() - start
+
+
+def main(sizes, batch_size):
+    database = Neo4jDatabase(ai.config.neo4j_connection_string, ai.config.neo4j_user, ai.config.neo4j_pwd)
+    create_constraints(database)
+    print(f'{"nodes":>8} {"edges":>8} {"legacy nodes/s":>15} {"nodes/s":>10} {"legacy edges/s":>15} {"edges/s":>10}')
+    try:
+        for size in sizes:
+            node_groups, edges = synthetic_graph(size, 5 * size, seed = size)
+
+            delete_workspace_graph(database, BENCHMARK_SPACE_ID)
+            legacy_nodes_secs = timed(legacy_create_discussion_nodes, database, node_groups)
+            legacy_edges_secs = timed(legacy_create_edges, database, edges)
+
+            delete_workspace_graph(database, BENCHMARK_SPACE_ID)
+            nodes_secs = timed(create_discussion_nodes, database, node_groups, batch_size)
+            edges_secs = timed(create_edges, database, edges, batch_size)
+
+            print(
+                f'{size:>8} {len(edges):>8} {size / legacy_nodes_secs:>15.0f} {size / nodes_secs:>10.0f} '
+                f'{len(edges) / legacy_edges_secs:>15.0f} {len(edges) / edges_secs:>10.0f}'
+            )
+    finally:
+        delete_workspace_graph(database, BENCHMARK_SPACE_ID)
+        database.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the Neo4j node & edge writers.')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [1000, 5000, 20000])
+    parser.add_argument('--batch-size', type = int, default = ai.config.neo4j_write_batch_size)
+    args = parser.parse_args()
+    main(args.sizes, args.batch_size)
@@ -0,0 +1,61 @@
+import spacy
+import argparse
+from timeit import default_timer
+import ai.config
+from ai.utils import Models, STAGE_COMPONENTS, pipe_stage
+from ai.summarization import run_textrank
+from benchmarks.similarity_benchmark import synthetic_corpus
+
+
+def docs_per_sec(docs):
+    start = default_timer()
+    count = sum(1 for _ in docs)
+    return count / (default_timer() - start)
+
+
+def full_textrank_pipeline(en_nlp):
+    """
+    A textrank pipeline with all components of the model,
+    as textrank ran before the stage views.
+    """
+    nlp = spacy.load('en_core_web_lg', vocab = en_nlp.vocab)
+    nlp.add_pipe('textrank', last = True)
+    nlp.add_pipe('textrank_summary', last = True, config = {
+        'limit_phrases': ai.config.top_n, 'limit_sentences': ai.config.top_sent
+    })
+    return nlp
+
+
+def main(size, batch_size):
+    en_nlp, _, _ = Models.load_models()
+    en_textrank, _ = Models.textrank_pipelines()
+    full_nlp = full_textrank_pipeline(en_nlp)
+    texts = [discussion['DiscussionText'] for discussion in synthetic_corpus(size)]
+
+    # The full pipeline (without textrank) is the baseline of the vectors and tagging stages.
+    full = docs_per_sec(full_nlp.pipe(texts, disable = ['textrank', 'textrank_summary'], batch_size = batch_size))
+    rates = [
+        ('vectors', full, docs_per_sec(pipe_stage(en_nlp, 'vectors', texts, batch_size))),
+        ('tagging', full, docs_per_sec(pipe_stage(en_nlp, 'tagging', texts, batch_size))),
+        ('textrank',
+         docs_per_sec(run_textrank(texts, full_nlp, batch_size = batch_size)),
+         docs_per_sec(run_textrank(texts, en_textrank, batch_size = batch_size)))
+    ]
+
+    print(f'{"stage":>10} {"components":>50} {"full/sec":>10} {"stage/sec":>10} {"speedup":>9}')
+    for stage, full_rate, stage_rate in rates:
+        components = ','.join(
+            name for name in full_nlp.pipe_names if name in STAGE_COMPONENTS[stage]
+        ) or 'tokenizer'
+        print(
+            f'{stage:>10} {components:>50} {full_rate:>10.1f} '
+            f'{stage_rate:>10.1f} {stage_rate / full_rate:>8.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the stage-specific spaCy pipelines.')
+    parser.add_argument('--size', type = int, default = 5000)
+    parser.add_argument('--batch-size', type = int, default = 1000)
+    args = parser.parse_args()
+    main(args.size, args.batch_size)
@@ -0,0 +1,100 @@
+import random
+import argparse
+from timeit import default_timer
+from ai.utils import remove_html, remove_html_soup
+from benchmarks.similarity_benchmark import WORDS
+
+
+# Texts which cover the fast paths and the fallback to BeautifulSoup.
+EQUIVALENCE_CASES = [
+    '',
+    '   ',
+    'Plain text without markup.',
+    '  Leading and trailing whitespace \n',
+    'Ελληνικό κείμενο με τόνους.',
+    'Entities: AT&amp;T, 5 &lt; 6, &quot;quoted&quot;, &#39;single&#39;, &euro;',
+    'Double escaped: &amp;amp; &amp;lt;b&amp;gt;',
+    'Escaped markup: &lt;b&gt;bold&lt;/b&gt;',
+    'A > B and C >= D',
+    'A bare ampersand & and a broken entity &foo; &#xZZ;',
+    '<p>One paragraph.</p>',
+    '<p>First</p><p>Second</p>',
+    '<p> spaced </p> \n <p> words </p>',
+    'Line<br>break<br/>and<br />more',
+    '<b>bold</b> and <i>italic</i> and <u>underline</u>',
+    '<a href="https://example.com/?a=1&amp;b=2" target=\'_blank\'>link</a>',
+    '<span style="color: red">red</span> text',
+    '<a title="a > b">greater</a>',
+    '<div><ul><li>one</li><li>two</li></ul></div>',
+    '<P CLASS=intro>Upper case tags</P>',
+    'Unclosed <b>bold and <i>italic',
+    'Stray </b> end tag',
+    '1 <3 2 and 4 < 5',
+    '<!-- a comment -->Visible',
+    '<script>var x = "<b>";</script>After script',
+    '<style>p { color: red; }</style>After style',
+    '<custom-tag>Custom element</custom-tag>',
+    '<table><tr><td>cell</td></tr></table>',
+    '<img src="x.png" alt="an image">Caption',
+    '<p>Unterminated <b',
+    '<!DOCTYPE html><html><body>Document</body></html>',
+    '<![CDATA[data]]>After',
+]
+
+
+def synthetic_texts(size, seed = 0):
+    """
+    Function which generates a reproducible mix of plain texts,
+    simple markup, complex HTML, and repeated texts.
+    """
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(size):
+        words = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 40)))
+        kind = rng.random()
+        if kind < 0.4:
+            texts.append(words)
+        elif kind < 0.8:
+            texts.append(f'<p>{words} <b>{rng.choice(WORDS)}</b> &amp; more</p><br>')
+        elif kind < 0.9:
+            texts.append(f'<!-- draft --><table><tr><td>{words}</td></tr></table>')
+        else:
+            texts.append(rng.choice(texts) if texts else words)
+    return texts
+
+
+def check_equivalence(texts):
+    mismatches = [text for text in texts if remove_html(text) != remove_html_soup(text)]
+    for text in mismatches:
+        print(f'MISMATCH {text!r}: {remove_html(text)!r} != {remove_html_soup(text)!r}')
+    return not mismatches
+
+
+def timed(func, texts):
+    start = default_timer()
+    for text in texts:
+        func(text)
+    return default_timer() - start
+
+
+def main(size):
+    texts = synthetic_texts(size)
+    equivalent = check_equivalence(EQUIVALENCE_CASES + texts)
+    print(f'Equivalent to BeautifulSoup: {equivalent}')
+
+    remove_html.cache_clear()
+    soup_secs = timed(remove_html_soup, texts)
+    cold_secs = timed(remove_html, texts)
+    warm_secs = timed(remove_html, texts)
+    print(f'{"path":>14} {"seconds":>9} {"texts/sec":>11} {"speedup":>9}')
+    for name, secs in [('beautifulsoup', soup_secs), ('fast (cold)', cold_secs), ('fast (memo)', warm_secs)]:
+        print(f'{name:>14} {secs:>9.3f} {size / secs:>11.0f} {soup_secs / secs:>8.1f}x')
+    if not equivalent:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark and check the fast HTML stripping path.')
+    parser.add_argument('--size', type = int, default = 20000)
+    args = parser.parse_args()
+    main(args.size)
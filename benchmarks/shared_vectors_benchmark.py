@@ -0,0 +1,64 @@
+import argparse
+import multiprocessing
+from timeit import default_timer
+import ai.config
+from ai.utils import load_spacy_model
+
+
+def memory_kb(field):
+    """
+    Function which reads a memory field (in kB) of the current process,
+    e.g. Rss, or Pss which splits the shared pages between their processes.
+    """
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+
+def load(model_name, shared, barrier, results):
+    ai.config.shared_vectors = shared
+    start = default_timer()
+    nlp = load_spacy_model(model_name)
+    nlp('Warm up the vectors of a short document.').vector
+    seconds = default_timer() - start
+
+    # Measure once all processes hold the model, so the shared pages are split.
+    barrier.wait()
+    results.put((seconds, memory_kb('Rss'), memory_kb('Pss')))
+    barrier.wait()
+
+
+def main(model_name, processes):
+    context = multiprocessing.get_context('spawn')
+
+    # Export the vectors once, so that the shared runs measure only their mapping.
+    ai.config.shared_vectors = True
+    load_spacy_model(model_name)
+
+    print(f'{"vectors":>8} {"processes":>10} {"load (s)":>9} {"RSS (MB)":>9} {"PSS (MB)":>9}')
+    for shared in [False, True]:
+        barrier, results = context.Barrier(processes), context.Queue()
+        workers = [
+            context.Process(target = load, args = (model_name, shared, barrier, results))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        measurements = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        seconds, rss, pss = (sum(values) / processes for values in zip(*measurements))
+        print(
+            f'{"mmap" if shared else "copy":>8} {processes:>10} {seconds:>9.2f} '
+            f'{rss / 1024:>9.0f} {pss / 1024:>9.0f}'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the memory-mapped spaCy vectors.')
+    parser.add_argument('--model', default = 'en_core_web_lg')
+    parser.add_argument('--processes', type = int, default = 4)
+    args = parser.parse_args()
+    main(args.model, args.processes)
@@ -0,0 +1,100 @@
+import random
+import tempfile
+import argparse
+from itertools import product # Cartesian
+from timeit import default_timer
+from spacy.tokens import Doc
+import ai.config
+from ai.utils import Models, preprocess
+from ai.features import extract_features
+from ai.similarity import textual_similarity
+
+
+WORDS = (
+    'city council budget school teacher park bicycle road traffic bus tram '
+    'energy solar panel tax citizen market housing rent water river tree '
+    'garden hospital doctor nurse library museum festival music street light '
+    'parking car pollution noise playground sport stadium police safety'
+).split()
+
+
+def synthetic_corpus(size, words_per_text = 12, seed = 0):
+    """
+    Function which generates a reproducible corpus of discussions.
+    """
+    rng = random.Random(seed)
+    return [
+        {'id': id, 'DiscussionText': ' '.join(rng.choice(WORDS) for _ in range(words_per_text))}
+        for id in range(size)
+    ]
+
+
+def matrix_similarity(en_nlp, el_nlp, lang_det, discussions, cutoff, block_size):
+    """
+    The feature extraction and matrix similarity path of the pipeline.
+    """
+    records = extract_features(discussions, en_nlp, el_nlp, lang_det)
+    return textual_similarity(
+        [record for record in records if record['Language'] == 'english'], cutoff, block_size
+    )
+
+
+def legacy_textual_similarity(nlp, language, source, target, cutoff):
+    """
+    The Doc.similarity cartesian implementation, kept as the baseline.
+    """
+    source_texts = [preprocess(text, nlp, language) for (_, text, language) in source]
+    target_texts = [preprocess(text, nlp, language) for (_, text, language) in target]
+    Doc.set_extension('neo4j_id', default = -1, force = True)
+    source_docs = list(nlp.pipe(source_texts))
+    target_docs = list(nlp.pipe(target_texts))
+    for (i, source_doc), (j, target_doc) in zip(enumerate(source_docs),
+                                                enumerate(target_docs)):
+        source_doc._.neo4j_id = source[i][0]
+        target_doc._.neo4j_id = source[j][0]
+    similarity_pairs = [(
+        min(element[0]._.neo4j_id, element[1]._.neo4j_id),
+        round(element[0].similarity(element[1]), 2),
+        max(element[0]._.neo4j_id, element[1]._.neo4j_id),
+        )
+        for element in product(source_docs, target_docs)
+        if element[0]._.neo4j_id != element[1]._.neo4j_id
+    ]
+    return [pair for pair in set(similarity_pairs) if pair[1] >= cutoff]
+
+
+def timed(func, *args):
+    start = default_timer()
+    result = func(*args)
+    return result, default_timer() - start
+
+
+def main(sizes, cutoff, block_size):
+    # Measure cold embeddings, instead of the persistent cache of the scheduler.
+    ai.config.embedding_cache_dir = tempfile.mkdtemp()
+    en_nlp, el_nlp, lang_det = Models.load_models()
+    print(f'{"texts":>8} {"legacy (s)":>12} {"matrix (s)":>12} {"speedup":>9} {"edges":>8} {"equal":>6}')
+    for size in sizes:
+        discussions = synthetic_corpus(size, seed = size)
+        matrix, matrix_secs = timed(matrix_similarity, en_nlp, el_nlp, lang_det, discussions, cutoff, block_size)
+
+        # Compare the same english texts, with the Doc.similarity loop.
+        corpus = [
+            (discussion['id'], discussion['DiscussionText'], 'english')
+            for discussion in discussions if discussion['Language'] == 'english'
+        ]
+        legacy, legacy_secs = timed(legacy_textual_similarity, en_nlp, 'english', corpus, corpus, cutoff)
+        print(
+            f'{size:>8} {legacy_secs:>12.3f} {matrix_secs:>12.3f} '
+            f'{legacy_secs / matrix_secs:>8.1f}x {len(matrix):>8} '
+            f'{str(set(legacy) == set(matrix)):>6}'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the all-pairs similarity engine.')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [100, 250, 500, 1000])
+    parser.add_argument('--cutoff', type = float, default = ai.config.cutoff)
+    parser.add_argument('--block-size', type = int, default = ai.config.similarity_block_size)
+    args = parser.parse_args()
+    main(args.sizes, args.cutoff, args.block_size)
@@ -0,0 +1,61 @@
+import random
+import argparse
+from timeit import default_timer
+import ai.config
+from ai.utils import Models
+from ai.summarization import summarize_batch
+from benchmarks.similarity_benchmark import WORDS
+
+
+def synthetic_jobs(size, sentences_per_text = 8, words_per_sentence = 12, seed = 0):
+    """
+    Function which generates a reproducible batch of
+    (key, text, language) summarization jobs, like the
+    joined texts of the communities of a workspace.
+    """
+    rng = random.Random(seed)
+    return [(
+        key,
+        ' '.join(
+            ' '.join(rng.choice(WORDS) for _ in range(words_per_sentence)).capitalize() + '.'
+            for _ in range(sentences_per_text)
+        ),
+        'english'
+    ) for key in range(size)]
+
+
+def per_document(jobs, en_textrank, el_textrank):
+    """
+    One document per textrank call, as the pipeline did per community.
+    """
+    summaries = {}
+    for key, text, language in jobs:
+        summaries.update(summarize_batch([(key, text, language)], en_textrank, el_textrank))
+    return summaries
+
+
+def timed(func, *args):
+    start = default_timer()
+    result = func(*args)
+    return result, default_timer() - start
+
+
+def main(sizes, processes, batch_size):
+    en_textrank, el_textrank = Models.textrank_pipelines()
+    print(f'{"texts":>8} {"mode":>14} {"seconds":>9} {"docs/sec":>10}')
+    for size in sizes:
+        jobs = synthetic_jobs(size, seed = size)
+        _, secs = timed(per_document, jobs, en_textrank, el_textrank)
+        print(f'{size:>8} {"per document":>14} {secs:>9.3f} {size / secs:>10.1f}')
+        for n_process in processes:
+            _, secs = timed(summarize_batch, jobs, en_textrank, el_textrank, n_process, batch_size)
+            print(f'{size:>8} {f"batch x{n_process}":>14} {secs:>9.3f} {size / secs:>10.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the batch summarization throughput.')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [50, 200, 1000])
+    parser.add_argument('--processes', type = int, nargs = '+', default = [1, 2, 4])
+    parser.add_argument('--batch-size', type = int, default = ai.config.textrank_batch_size)
+    args = parser.parse_args()
+    main(args.sizes, args.processes, args.batch_size)
@@ -1,63 +1,84 @@
-import time
 import logging
-import schedule
+import threading
+import ai.config
 import ai.utils
 from timeit import default_timer
-from server.analyze import analyze
+from pymongo import MongoClient
+from concurrent.futures import ThreadPoolExecutor
+from ai.neo4j_wrapper import Neo4jDatabase
+from server.analyze import MLPipeline
+from server.jobs import (
+    FixedRateTrigger,
+    CronTrigger,
+    MongoLock,
+    JobRunner,
+    watch_triggers
+)
 
 
-# Load models once and set analyze to run only once per hour.
-en_nlp, el_nlp, lang_det = ai.utils.Models.load_models()
+# The job of the runner, which calls the ML Pipeline, until it must stop.
+# The models are loaded lazily, once, and reused by every run.
+def work(stop):
+    MLPipeline(*ai.utils.Models.load_models(), stop = stop)
 
 
-# The wrapper function that runs analyze for the first time only.
-def run_first_time():
-    logging.info('ML Pipeline: First Run.')
-    analyze(en_nlp, el_nlp, lang_det, first_run = True)
-    return schedule.CancelJob
+def ping_mongo():
+    client = MongoClient(ai.config.mongo_connection_string, serverSelectionTimeoutMS = 5000)
+    try:
+        client.admin.command('ping')
+    finally:
+        client.close()
 
 
-# The wrapper function which calls analyze.
-def work():
-    analyze(en_nlp, el_nlp, lang_det)
+def wait_for_services():
+    """
+    Function which waits, with backoff, until MongoDB
+    and (unless the in-process graph backend is used) Neo4j
+    accept queries, instead of sleeping for a fixed time.
+    """
+    probes = {'MongoDB': ping_mongo}
+    if ai.config.graph_backend == 'neo4j':
+        probes['Neo4j'] = lambda: Neo4jDatabase.shared().ping()
+    for name, probe in probes.items():
+        ai.utils.wait_until_ready(
+            name, probe, ai.config.services_ready_timeout,
+            ai.config.services_ready_max_delay
+        )
 
 
-def scheduler(schedule_interval_secs = 60*60):
+def scheduler(schedule_interval_secs = ai.config.scheduler_interval_secs,
+              cron = ai.config.scheduler_cron):
 
-    # Run the analyze() for the first time and measure its processing time.
-    # Add a stalling amount of time, so Neo4j has time to start.
+    # Load the models in the background, while waiting for Neo4j & MongoDB to start.
     start = default_timer()
-    time.sleep(30)
-    schedule.every(0).seconds.do(run_first_time)
-    schedule.run_all()
-    end = default_timer()
-    
-    # Initialize the processing time and the iteration tick.
-    processing_time, tick = round(end - start), 0
-
-    # Keep running the scheduler indefinitely, until the process is manually stopped.
-    # Every loop iteration adds a few msec of timeshift.
-    while True:
-        if tick + processing_time >= schedule_interval_secs:
-        
-            # Measure the processing time.
-            start = default_timer()
-        
-            # Schedule the job instantly, execute it and unschedule it.
-            job = schedule.every(0).seconds.do(work)
-            schedule.run_all()
-            schedule.cancel_job(job)
-        
-            end = default_timer()
-
-            # Set the new processing time and reset the tick.
-            processing_time, tick = round(end - start), 0
-
-        # Set the loop iteration to 1 sec.
-        time.sleep(1)
-
-        # The tick represents one time unit of the iteration.
-        tick += 1
-
-
-if __name__ == '__main__': scheduler()
\ No newline at end of file
+    with ThreadPoolExecutor(max_workers = 1) as executor:
+        models = executor.submit(ai.utils.Models.load_models)
+        wait_for_services()
+        models.result()
+    logging.info(f'Scheduler started in {default_timer() - start:.1f} secs.')
+
+    # Run the ML Pipeline on a cron schedule, or at a fixed rate, without drift.
+    # Only one run may hold the lock of the pipeline, across all schedulers,
+    # and every run is stored in the pipeline runs collection.
+    mongo_database = MongoClient(ai.config.mongo_connection_string)['inpoint']
+    runner = JobRunner(
+        'MLPipeline', work,
+        CronTrigger(cron) if cron else FixedRateTrigger(schedule_interval_secs),
+        MongoLock(mongo_database['locks'], 'MLPipeline', ai.config.pipeline_lock_lease_secs),
+        mongo_database['pipeline_runs']
+    )
+
+    # Run the ML Pipeline when a run is requested, e.g. through the API.
+    threading.Thread(
+        target = watch_triggers,
+        args = (mongo_database['pipeline_triggers'], runner, ai.config.trigger_poll_interval_secs),
+        daemon = True
+    ).start()
+
+    # Run the ML Pipeline for the first time, then keep running it
+    # indefinitely, until the process is manually stopped.
+    runner.request_run('startup')
+    runner.run_forever()
+
+
+if __name__ == '__main__': scheduler()
@@ -1,141 +1,304 @@
-import sys
+import uuid
+import orjson
+import multiprocessing
 import logging
 import datetime
 import ai.config
 import ai.utils
+import ai.ingestion
 from ai.utils import counter
-from ai.neo4j_wrapper import (
-    Neo4jDatabase, 
-    GraphAlgos
-)
+from ai.neo4j_wrapper import Neo4jDatabase
 from ai.select import (
     summarize_communities,
     aggregate_summaries_keyphrases
 )
 from ai.create import (
     extract_node_groups,
-    create_discussion_nodes,
-    create_similarity_graph
+    create_constraints,
+    delete_removed_workspace_graphs
+)
+from ai.graph_backend import (
+    Neo4jGraph,
+    InProcessGraph
 )
 from ai.classification import ArgumentClassifier
 from ai.clustering import ArgumentClusterer
+from ai.embedding_cache import EmbeddingCache
+from ai.features import extract_features, extract_text_features
 from pymongo import MongoClient
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+
+
+def publish_analysis_version(mongo_database):
+    """
+    Function which stamps a new version of the stored analyses,
+    so that the API invalidates its cached responses.
+    """
+    mongo_database['analysis_versions'].replace_one(
+        {'_id': 'workspaces'},
+        {'_id': 'workspaces', 'version': uuid.uuid4().hex, 'date': datetime.datetime.utcnow()},
+        upsert = True
+    )
 
 
 @counter
-def MLPipeline(en_nlp, el_nlp, lang_det, first_run = False):
+def MLPipeline(en_nlp, el_nlp, lang_det,
+               incremental = ai.config.incremental_analysis,
+               workers = ai.config.pipeline_workers,
+               stop = None):
 
     # Connect to the mongodb database.
+    # Concurrent runs are prevented by the lock of the job runner.
     client = MongoClient(ai.config.mongo_connection_string)
     mongo_database = client['inpoint']
-    
-    # Throttle the use of the MLPipeline.
-    throttles_collection = mongo_database['throttles']
-    res = throttles_collection.find_one()
     now = datetime.datetime.now()
 
-    # Check if it not the first run 
-    # and there is an entry to the throttle table to early return.
-    if not first_run and res is not None:
-        elapsed = now - res['date']
-        if elapsed < datetime.timedelta(minutes = 45):
-            warning = 'MLPipeline Throttling: Please try again later!'
-            print(warning, file = sys.stderr)
-            logging.warning(warning)
-            return
+    # Reuse the pooled neo4j database connection of this process.
+    database = Neo4jDatabase.shared()
 
-    # Remove the old entry and save the current timestamp.
-    throttles_collection.remove({})
-    throttles_collection.insert_one({'date': now})
+    try:
+        # Stream the workspaces & their discussions from the Ergologic backend,
+        # grouped by workspace, ignoring the discussions of unknown workspaces.
+        try:
+            results = ai.ingestion.ingest_ergologic()
+            # If we have not received any results, early return.
+            if results is None:
+                return
+            workspaces, groups = results
+        except Exception as e:
+            logging.exception(e) # Log this exception and re-raise it for analyze.
+            raise Exception(e)
 
-    # Connect to the neo4j database.
-    database = Neo4jDatabase(ai.config.neo4j_connection_string, ai.config.neo4j_user, ai.config.neo4j_pwd)
+        workspace_ids = [wsp['id'] for wsp in workspaces]
+        workspaces_by_id = {wsp['id']: wsp for wsp in workspaces}
+        workspaces_collection = mongo_database['workspaces']
+        fingerprints_collection = mongo_database['fingerprints']
+        serialized_collection = mongo_database['serialized_workspaces']
 
-    # Retrieve data from the Ergologic backend.
-    # data json format: {'workspaces': [], 'discussions': []}
-    try:
-        results = ai.utils.get_data_from_ergologic()
-        # If we have not received any results, early return.
-        if results is None:
+        # Delete the analyses of the workspaces that no longer exist.
+        deleted = workspaces_collection.delete_many({'_id': {'$nin': workspace_ids}})
+        fingerprints_collection.delete_many({'_id': {'$nin': workspace_ids}})
+        serialized_collection.delete_many({'_id': {'$nin': workspace_ids}})
+        if deleted.deleted_count:
+            publish_analysis_version(mongo_database)
+
+        # Create the constraints & indexes of the graph, shared by all workspaces,
+        # and delete the graphs of the workspaces that no longer exist.
+        if ai.config.graph_backend == 'neo4j':
+            create_constraints(database)
+            delete_removed_workspace_graphs(database, workspace_ids, ai.config.neo4j_delete_batch_size)
+
+        # In incremental mode, skip the workspaces with an unchanged fingerprint.
+        stored_fingerprints = {
+            fingerprint['_id']: fingerprint['fingerprint']
+            for fingerprint in fingerprints_collection.find()
+        } if incremental else {}
+
+        def stop_if_requested():
+            if stop is not None and stop.is_set():
+                raise RuntimeError('MLPipeline: The run was stopped.')
+
+        # The classifiers are trained on the arguments of every workspace,
+        # but only their texts & labels are kept, not the full discussions.
+        samples, wsp_samples, fingerprints = [], {}, {}
+
+        def changed_workspaces():
+            # Consume the workspaces one at a time, so that only the discussions
+            # & features of the workspaces being analyzed are held in memory.
+            for wsp_id, wsp_discussions in groups:
+                stop_if_requested()
+                # Fingerprint each workspace, based on the ids, positions and texts of its discussions.
+                fingerprints[wsp_id] = ai.utils.workspace_fingerprint(wsp_discussions)
+                # Only the language & clean text are extracted here, for the classifiers;
+                # the heavier features are extracted by the analysis of the workspace.
+                extract_text_features(wsp_discussions, lang_det)
+                wsp_samples[wsp_id] = ArgumentClassifier.samples(wsp_discussions)
+                samples.extend(wsp_samples[wsp_id])
+                if stored_fingerprints.get(wsp_id) != fingerprints[wsp_id]:
+                    yield workspaces_by_id[wsp_id], wsp_discussions
+                else:
+                    del wsp_samples[wsp_id]
+
+        # The analyses of the changed workspaces, without their suggested argument types.
+        analyses = {}
+
+        def collect(wsp_id, analysis):
+            # Keep only the analyses which fully succeeded. A failed workspace
+            # is neither stored nor fingerprinted, so the next run analyzes it again.
+            try:
+                analyses[wsp_id] = analysis()
+            except MemoryError as e:
+                # The graph of the workspace does not fit the memory limit of GDS, skip it.
+                logging.warning(f'MLPipeline: Skipped workspace {wsp_id}, its graph job was refused: {e}')
+            except Exception:
+                logging.exception(
+                    f'MLPipeline: The analysis of workspace {wsp_id} failed, it is retried on the next run.'
+                )
+
+        def merged(future):
+            # Merge the embeddings a worker read & computed into the cache of this process.
+            result, updates = future.result()
+            EmbeddingCache.default().merge(*updates)
+            return result
+
+        if workers > 1:
+            # Fan the workspaces out to the worker processes, keeping
+            # at most as many workspaces in flight as there are workers.
+            # The workers read the embedding cache as persisted on disk.
+            # They are spawned, not forked, since the ingestion threads are still running.
+            EmbeddingCache.default().flush()
+            with ProcessPoolExecutor(max_workers = workers, mp_context = multiprocessing.get_context('spawn'),
+                                     initializer = init_worker) as executor:
+                futures = {}
+                for wsp, wsp_discussions in changed_workspaces():
+                    futures[executor.submit(analyze_workspace_in_worker, wsp, wsp_discussions)] = wsp['id']
+                    if len(futures) >= workers:
+                        done, _ = wait(futures, return_when = FIRST_COMPLETED)
+                        for future in done:
+                            collect(futures.pop(future), lambda: merged(future))
+                for future in as_completed(futures):
+                    collect(futures[future], lambda: merged(future))
+        else:
+            for wsp, wsp_discussions in changed_workspaces():
+                collect(wsp['id'], lambda: analyze_workspace(
+                    database, wsp, wsp_discussions, en_nlp, el_nlp, lang_det
+                ))
+
+        # If no workspace was analyzed, early return.
+        if not analyses:
+            logging.info('MLPipeline: No changed workspace was analyzed in this run.')
             return
-        workspaces, discussions = results
-    except Exception as e:
-        logging.exception(e) # Log this exception and re-raise it for analyze.
-        raise Exception(e)
-
-    # Train the argument classifier from every text.
-    ArgumentClassifier.train_classifiers(discussions, lang_det)
-
-    # Each workspace will hold a list of results.
-    results = []
-
-    for wsp in workspaces:
-        # Delete the entire workspace graph.
-        database.execute('MATCH (n) OPTIONAL MATCH (n)-[r]-() DELETE n,r', 'w')
-
-        # Only include discussions that match the current workspace.
-        wsp_discussions = [
-            discussion for discussion in discussions 
-            if discussion['SpaceId'] == wsp['id']
-        ]
-
-        # Suggest new argument types for each argument of each discussion in the current workspace.
-        wsp_suggestions = ArgumentClassifier.suggest_argument_types(wsp_discussions, lang_det)
-
-        # Sort similar arguments into clusters, and return their medoid text and summary.
-        wsp_clusters = ArgumentClusterer.suggest_clusters(wsp_discussions, lang_det, en_nlp, el_nlp)
-
-        # Create node groups from the discussions object.
-        node_groups = \
-            extract_node_groups(wsp_discussions, ai.config.node_types, ai.config.fields)
-
-        # Create the discussion nodes in the Neo4j Database.
-        create_discussion_nodes(database, node_groups)
-
-        # Create the similarity graph.
-        create_similarity_graph(
-            database, node_groups, 
-            en_nlp, el_nlp, lang_det, ai.config.cutoff
-        )
-
-        # Calculate the community score for the similarity graph.
-        with GraphAlgos(database, ['Node'], ['is_similar']) as similarity_graph:
-            similarity_graph.louvain(write_property = 'community')
-
-        # Group summaries based on their node types.
-        node_groups = {node: {'Summaries': []}
-                      for node in ai.config.node_types if node != 'Issue'}
-
-        # Summarize each community of discussions and group them based on their position.
-        for id, [position, _, summary] in summarize_communities(
-                                                      database, en_nlp, el_nlp, 
-                                                      lang_det, ai.config.top_n, 
-                                                      ai.config.top_sent).items():   
-            node_groups[position]['Summaries'].append(summary)
-
-        # Produce an aggregated summary and keyphrases.
-        aggregated = aggregate_summaries_keyphrases(
-            node_groups, lang_det, en_nlp, el_nlp, ai.config.top_n, ai.config.top_sent
-        )
-        
-        # Each workspace is a dict object, which contains
-        # its id, text summaries grouped by node (argument)
-        # type, an aggregated summary and a list of keyphrases.
-        results.append({'_id': wsp['id'], **aggregated, **node_groups, **wsp_suggestions, **wsp_clusters})
-
-    # Delete older summaries & keyphrases
-    # from all workspaces and insert the newly created ones.
-    workspaces_collection = mongo_database['workspaces']
-    workspaces_collection.remove({})
-    workspaces_collection.insert_many(results)
+        logging.info(f'MLPipeline: Analyzed {len(analyses)} changed workspaces.')
+
+        # Never store the analyses, if the run must stop, e.g. since its lock was lost.
+        stop_if_requested()
+
+        # Train the argument classifier from every text.
+        ArgumentClassifier.train_classifiers(samples)
+
+        for wsp_id, result in analyses.items():
+            # Suggest new argument types for each argument of the workspace.
+            result.update(ArgumentClassifier.suggest_argument_types(wsp_samples[wsp_id]))
+
+            # Replace the older summaries & keyphrases of this workspace only,
+            # alongside its pre-serialized JSON, which the API serves as is,
+            # then store its fingerprint, only once its analysis is stored,
+            # so that it is skipped until it changes.
+            workspaces_collection.replace_one({'_id': wsp_id}, result, upsert = True)
+            serialized_collection.replace_one(
+                {'_id': wsp_id}, {'_id': wsp_id, 'json': orjson.dumps(result)}, upsert = True
+            )
+            fingerprints_collection.replace_one(
+                {'_id': wsp_id},
+                {'_id': wsp_id, 'fingerprint': fingerprints[wsp_id], 'date': now},
+                upsert = True
+            )
+        publish_analysis_version(mongo_database)
+    finally:
+        # Persist the embeddings, even if the run fails or returns early,
+        # so the next run only embeds new or edited texts.
+        EmbeddingCache.default().flush()
+        database.log_timings()
 
     return
 
 
+@counter
+def analyze_workspace(database, wsp, wsp_discussions, en_nlp, el_nlp, lang_det):
+    """
+    Function which analyzes the discussions of a single workspace,
+    isolated in the Neo4j graph by its SpaceId, or in an in-process graph,
+    depending on the graph backend, and returns its analysis.
+    """
+    # Extract the language, clean text, preprocessed text & vectors
+    # of every discussion once, for all the stages of its analysis.
+    extract_features(wsp_discussions, en_nlp, el_nlp, lang_det)
+
+    # Index the extracted features of the workspace discussions by their id.
+    features = {discussion['id']: discussion for discussion in wsp_discussions}
+
+    # The prebuilt textrank pipelines, which share the vocab of the NLP models.
+    en_textrank, el_textrank = ai.utils.Models.textrank_pipelines()
+
+    # Sort similar arguments into clusters, and return their medoid text and summary.
+    wsp_clusters = ArgumentClusterer.suggest_clusters(wsp_discussions, en_textrank, el_textrank)
+
+    # Create node groups from the discussions object.
+    node_groups = \
+        extract_node_groups(wsp_discussions, ai.config.node_types, ai.config.fields)
+
+    # Select the graph backend of the workspace.
+    graph = (
+        InProcessGraph()
+        if ai.config.graph_backend == 'memory'
+        else Neo4jGraph(database, wsp['id'], ai.config.gds_max_memory_bytes,
+                        ai.config.neo4j_delete_batch_size)
+    )
+
+    # Create the discussion nodes and the similarity graph.
+    graph.create(
+        node_groups, features, ai.config.cutoff,
+        ai.config.similarity_block_size,
+        ai.config.ann_threshold, ai.config.ann_max_degree,
+        ai.config.neo4j_write_batch_size
+    )
+
+    # Calculate the community score for the similarity graph of this workspace.
+    graph.louvain()
+
+    # Group summaries based on their node types.
+    node_groups = {node: {'Summaries': []}
+                  for node in ai.config.node_types if node != 'Issue'}
+
+    # Summarize each community of discussions and group them based on their position.
+    for id, [position, _, summary] in summarize_communities(
+                                                  graph.communities(), en_textrank, el_textrank,
+                                                  lang_det, ai.config.textrank_n_process,
+                                                  ai.config.textrank_batch_size).items():
+        node_groups[position]['Summaries'].append(summary)
+
+    # Produce an aggregated summary and keyphrases.
+    aggregated = aggregate_summaries_keyphrases(
+        node_groups, lang_det, en_textrank, el_textrank, ai.config.top_n
+    )
+
+    # Each workspace is a dict object, which contains
+    # its id, text summaries grouped by node (argument)
+    # type, an aggregated summary and a list of keyphrases.
+    # The suggested argument types are added by the pipeline,
+    # once the classifiers are trained on every workspace.
+    return {'_id': wsp['id'], **aggregated, **node_groups, **wsp_clusters}
+
+
+# The models & Neo4j connection of each worker process of the pipeline.
+worker_state = {}
+
+
+def init_worker():
+    """
+    Initializer of each worker process, which opens the embedding cache
+    read-only, loads the models and connects to Neo4j once,
+    for all the workspaces it analyzes.
+    """
+    EmbeddingCache.default(read_only = True)
+    worker_state['models'] = ai.utils.Models.load_models()
+    ai.utils.Models.textrank_pipelines()
+    worker_state['database'] = Neo4jDatabase.shared()
+
+
+def analyze_workspace_in_worker(wsp, wsp_discussions):
+    # Return the analysis, alongside the embeddings to merge into the cache.
+    en_nlp, el_nlp, lang_det = worker_state['models']
+    result = analyze_workspace(
+        worker_state['database'], wsp, wsp_discussions, en_nlp, el_nlp, lang_det
+    )
+    return result, EmbeddingCache.default().take_updates()
+
+
 # Log all possible exceptions from the ML Pipeline.
-def analyze(en_nlp, el_nlp, lang_det, first_run = False):
+def analyze(en_nlp, el_nlp, lang_det):
     try:
-        MLPipeline(en_nlp, el_nlp, lang_det, first_run)
+        MLPipeline(en_nlp, el_nlp, lang_det)
     except Exception as e:
         logging.exception(e)
     return
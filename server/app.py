@@ -1,19 +1,29 @@
+import hmac
+import orjson
+import hashlib
 import ai.config
-from typing import List
-from fastapi import FastAPI
-from fastapi import Query
-from fastapi.responses import JSONResponse
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException
+from fastapi import Query, Header
+from fastapi.responses import ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pymongo import MongoClient
+from server.cache import TTLCache
+from server.database.analysis_database import (
+    client as analysis_client,
+    retrieve_analysis_version,
+    retrieve_workspaces,
+    retrieve_workspaces_json,
+    add_pipeline_trigger
+)
 
 
-app = FastAPI(docs_url = '/docs', redoc_url = None)
+app = FastAPI(docs_url = '/docs', redoc_url = None, default_response_class = ORJSONResponse)
 origins = ["*"]
 app.add_middleware(
     CORSMiddleware,
     allow_origins = origins,
     allow_credentials = True,
-    allow_methods = ["GET"],
+    allow_methods = ["GET", "POST"],
     allow_headers = ["*"],
 )
 
@@ -24,18 +34,61 @@ async def read_root():
     return {'message': 'Welcome to the inPOINT AI backend!'}
 
 
+# The cached responses of the analysis, by the version of the analyses and the request.
+analysis_cache = TTLCache(ai.config.analysis_cache_size, ai.config.analysis_cache_ttl)
+cached_version = {'version': None}
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Function which checks whether the ETag is listed in an If-None-Match header.
+    """
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
 # The endpoint which serves the results of the AI Analysis from MongoDB.
+# The response is cached until the scheduler writes a new analysis, and its ETag
+# depends only on the version of the analyses and the request, so polling clients get 304s.
 @app.get('/get-analysis', tags = ['Root'])
-async def get_analysis(q: List[int] = Query(...)):
-    workspace_ids = q
-    client = MongoClient(ai.config.mongo_connection_string)
-    mongo_database = client['inpoint']
-    workspaces_collection = mongo_database['workspaces']
-    workspaces = workspaces_collection.find({'_id': {'$in': workspace_ids}})
-
-    # If there are no workspaces, return early.
-    if workspaces is None:
-        not_found_response = {}
-        return JSONResponse(content = not_found_response, status_code = 404)
-
-    return {'workspaces': list(workspaces)}
+async def get_analysis(q: List[int] = Query(...), fields: List[str] = Query(None),
+                       if_none_match: Optional[str] = Header(None)):
+    workspace_ids, fields = sorted(set(q)), sorted(set(fields or []))
+    version = await retrieve_analysis_version()
+
+    # Drop the responses of the older analyses.
+    if version != cached_version['version']:
+        analysis_cache.clear()
+        cached_version['version'] = version
+
+    key = (version, tuple(workspace_ids), tuple(fields))
+    etag = '"' + hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if if_none_match is not None and etag_matches(etag, if_none_match):
+        return Response(status_code = 304, headers = headers)
+
+    # Cache the serialized response, so that hits only write bytes.
+    content = analysis_cache.get(key)
+    if content is None:
+        if fields:
+            content = orjson.dumps({'workspaces': await retrieve_workspaces(workspace_ids, fields)})
+        else:
+            content = await retrieve_workspaces_json(workspace_ids)
+        analysis_cache.set(key, content)
+    return Response(content = content, media_type = 'application/json', headers = headers)
+
+
+@app.on_event('shutdown')
+async def close_analysis_client():
+    analysis_client.close()
+
+
+# The endpoint which requests a run of the ML Pipeline, e.g. when new discussions arrive.
+# Only the clients which send the shared secret in the X-Trigger-Key header may request runs.
+@app.post('/trigger-analysis', tags = ['Root'], status_code = 202)
+async def trigger_analysis(reason: str = 'on-demand', x_trigger_key: Optional[str] = Header(None)):
+    if not ai.config.trigger_api_key or \
+            not hmac.compare_digest((x_trigger_key or '').encode('utf-8'), ai.config.trigger_api_key.encode('utf-8')):
+        raise HTTPException(status_code = 403, detail = 'A valid X-Trigger-Key header is required.')
+    await add_pipeline_trigger(reason)
+    return {'message': 'The analysis will run as soon as possible.'}
@@ -0,0 +1,32 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    In-process cache, which evicts its least recently used entries
+    beyond its capacity, and expires each entry after ttl seconds.
+    """
+    def __init__(self, capacity = 1024, ttl = 300):
+        self.capacity, self.ttl = capacity, ttl
+        self.__entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.__entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self.__entries[key]
+            return None
+        self.__entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self.__entries[key] = (time.monotonic() + self.ttl, value)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.capacity:
+            self.__entries.popitem(last = False)
+
+    def clear(self):
+        self.__entries.clear()
@@ -0,0 +1,67 @@
+import orjson
+import motor.motor_asyncio
+import ai.config
+from server.jobs import trigger_document
+
+# The client is shared by all requests of the application, and closed on shutdown.
+client = motor.motor_asyncio.AsyncIOMotorClient(
+    ai.config.mongo_connection_string,
+    maxPoolSize = ai.config.mongo_max_pool_size,
+    minPoolSize = ai.config.mongo_min_pool_size
+)
+
+database = client['inpoint']
+
+workspaces_collection = database.get_collection('workspaces')
+analysis_versions_collection = database.get_collection('analysis_versions')
+serialized_workspaces_collection = database.get_collection('serialized_workspaces')
+pipeline_triggers_collection = database.get_collection('pipeline_triggers')
+
+async def retrieve_analysis_version() -> str:
+    """
+    Function which returns the version of the analyses, as published
+    by the scheduler on every write. It is read on every request,
+    with a single lookup by _id, so a new analysis is served at once.
+    """
+    stamp = await analysis_versions_collection.find_one({'_id': 'workspaces'})
+    return stamp['version'] if stamp else ''
+
+
+async def retrieve_workspaces(workspace_ids: list, fields: list = None) -> list:
+    """
+    Function which returns the analyses of the given workspaces,
+    with only the requested fields, if any.
+    """
+    projection = {field: 1 for field in fields} if fields else None
+    cursor = workspaces_collection.find({'_id': {'$in': workspace_ids}}, projection)
+    return await cursor.to_list(length = None)
+
+
+async def retrieve_workspaces_json(workspace_ids: list) -> bytes:
+    """
+    Function which returns the JSON response of the analyses
+    of the given workspaces, by concatenating the documents
+    pre-serialized by the scheduler. Workspaces analyzed before
+    the documents were pre-serialized are serialized on the fly.
+    """
+    documents = {
+        document['_id']: document['json']
+        async for document in serialized_workspaces_collection.find({'_id': {'$in': workspace_ids}})
+    }
+    missing = [workspace_id for workspace_id in workspace_ids if workspace_id not in documents]
+    if missing:
+        for workspace in await retrieve_workspaces(missing):
+            documents[workspace['_id']] = orjson.dumps(workspace)
+    return b''.join([
+        b'{"workspaces":[',
+        b','.join(documents[workspace_id] for workspace_id in workspace_ids if workspace_id in documents),
+        b']}'
+    ])
+
+
+async def add_pipeline_trigger(reason: str = 'on-demand'):
+    """
+    Function which requests a run of the ML Pipeline,
+    storing the same trigger document as server.jobs.request_run.
+    """
+    await pipeline_triggers_collection.insert_one(trigger_document(reason))
@@ -75,6 +75,13 @@ async def retrieve_discourse_item(id: str, client: str = 'frontend') -> dict:
         return discourse_item_data
 
 
+async def retrieve_discourse_items_by_ids(ids: list, client: str = 'frontend') -> dict:
+    discourse_items = {}
+    async for discourse_item in discourse_items_collection.find({'_id': {'$in': ids}}):
+        discourse_items[discourse_item['_id']] = discourse_item_from_database(discourse_item, client)
+    return discourse_items
+
+
 async def update_discourse_item(id: str, data: dict):
     if len(data) < 1:
         return False
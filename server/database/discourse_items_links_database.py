@@ -65,6 +65,14 @@ async def retrieve_discourse_items_link(id: str, client: str = 'frontend') -> di
         return discourse_items_link_data
 
 
+async def retrieve_discourse_items_links_by_ids(ids: list, client: str = 'frontend') -> dict:
+    discourse_items_links = {}
+    async for discourse_items_link in discourse_items_links_collection.find({'_id': {'$in': ids}}):
+        discourse_items_links[discourse_items_link['_id']] = discourse_items_link_from_database(
+            discourse_items_link, client)
+    return discourse_items_links
+
+
 async def update_discourse_items_link(id: str, data: dict):
     if len(data) < 1:
         return False
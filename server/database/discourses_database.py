@@ -1,10 +1,16 @@
+import asyncio
 import motor.motor_asyncio
 from decouple import config
 from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
 
-from server.database.discourse_items_database import delete_discourse_item, add_discourse_item, retrieve_discourse_item
+from server.database.discourse_items_database import (delete_discourse_item, add_discourse_item,
+                                                      retrieve_discourse_items_by_ids, discourse_item_for_database,
+                                                      discourse_item_from_database)
 from server.database.discourse_items_links_database import (delete_discourse_items_link, add_discourse_items_link,
-                                                            retrieve_discourse_items_link)
+                                                            retrieve_discourse_items_links_by_ids,
+                                                            discourse_items_link_for_database,
+                                                            discourse_items_link_from_database)
 
 MONGO_INITDB_ROOT_USERNAME = config('MONGO_INITDB_ROOT_USERNAME')
 MONGO_INITDB_ROOT_PASSWORD = config('MONGO_INITDB_ROOT_PASSWORD')
@@ -17,50 +23,43 @@ database = client.inPOINT
 
 discourses_collection = database.get_collection('discourses')
 
-
-async def discourse_from_database(discourse, client: str = 'frontend') -> dict:
-    discourse_items_ids = list(discourse['discourseItems'])
-    discourse_items_data = []
-    for discourse_item_id in discourse_items_ids:
-        discourse_item_data = await retrieve_discourse_item(str(discourse_item_id), client)
-        discourse_items_data.append(discourse_item_data)
-
-    discourse_items_links_ids = list(discourse['discourseItemsLinks'])
-    discourse_items_links_data = []
-    for discourse_items_links_id in discourse_items_links_ids:
-        discourse_items_link_data = await retrieve_discourse_items_link(str(discourse_items_links_id), client)
-        discourse_items_links_data.append(discourse_items_link_data)
-    if client == 'frontend':
-        results = {
-            'id': str(discourse['_id']),
-            'data': discourse_items_data + discourse_items_links_data
-        }
-        # results = [{'id': str(discourse['_id'])}]
-        # results = results + discourse_items_data + discourse_items_links_data
-    elif client == 'ai':
-        results = {
-            'id': str(discourse['_id']),
-            'nodes': discourse_items_data,
-            'edges': discourse_items_links_data
-        }
+# The bulk write path uses the collections of this client, so that they can share a transaction.
+bulk_discourse_items_collection = database.get_collection('discourseItems')
+bulk_discourse_items_links_collection = database.get_collection('discourseItemsLinks')
+
+
+async def discourses_from_database(discourses: list, client: str = 'frontend') -> list:
+    # Fetch the items and links of all discourses with one $in query each, instead of one query per id.
+    discourse_items_ids = [ObjectId(str(id)) for discourse in discourses for id in discourse['discourseItems']]
+    discourse_items_links_ids = [ObjectId(str(id)) for discourse in discourses
+                                 for id in discourse['discourseItemsLinks']]
+    discourse_items, discourse_items_links = await asyncio.gather(
+        retrieve_discourse_items_by_ids(discourse_items_ids, client),
+        retrieve_discourse_items_links_by_ids(discourse_items_links_ids, client))
+
+    results = []
+    for discourse in discourses:
+        # Preserve the order of the ids of each discourse.
+        discourse_items_data = [discourse_items.get(ObjectId(str(id))) for id in discourse['discourseItems']]
+        discourse_items_links_data = [discourse_items_links.get(ObjectId(str(id)))
+                                      for id in discourse['discourseItemsLinks']]
+        if client == 'frontend':
+            results.append({
+                'id': str(discourse['_id']),
+                'data': discourse_items_data + discourse_items_links_data
+            })
+        elif client == 'ai':
+            results.append({
+                'id': str(discourse['_id']),
+                'nodes': discourse_items_data,
+                'edges': discourse_items_links_data
+            })
     return results
 
 
-async def discourse_add_discourse_items_and_links(discourse_data: dict, include_id: bool = False):
-    discourse_items_data = discourse_data['discourseItems']
-    discourse_items_ids = []
-    for discourse_item_data in discourse_items_data:
-        discourse_item = await add_discourse_item(discourse_item_data, include_id)
-        discourse_items_ids.append(ObjectId(discourse_item['data']['id']))
-    discourse_data['discourseItems'] = discourse_items_ids
-
-    discourse_items_links_data = discourse_data['discourseItemsLinks']
-    discourse_items_links_ids = []
-    for discourse_items_links_data in discourse_items_links_data:
-        discourse_items_link = await add_discourse_items_link(discourse_items_links_data, include_id)
-        discourse_items_links_ids.append(ObjectId(discourse_items_link['data']['id']))
-    discourse_data['discourseItemsLinks'] = discourse_items_links_ids
-    return discourse_data
+async def discourse_from_database(discourse, client: str = 'frontend') -> dict:
+    results = await discourses_from_database([discourse], client)
+    return results[0]
 
 
 async def update_discourse_add_discourse_item(discourse, discourse_data: dict):
@@ -142,11 +141,32 @@ async def discourse_delete_discourse_items_and_links(discourse):
     return True
 
 
-async def retrieve_discourses(client: str):
-    discourses = []
-    async for discourse in discourses_collection.find():
-        discourse_data = await discourse_from_database(discourse, client)
-        discourses.append(discourse_data)
+def discourses_after(after: str = None) -> dict:
+    return {'_id': {'$gt': ObjectId(after)}} if after else {}
+
+
+async def stream_discourses(client: str, after: str = None, batch_size: int = 100):
+    # Yield the discourses in _id order, assembling them in batches,
+    # so each batch costs a constant number of round-trips and memory stays flat.
+    cursor = discourses_collection.find(discourses_after(after)).sort('_id', 1).batch_size(batch_size)
+    while True:
+        batch = await cursor.to_list(length=batch_size)
+        if not batch:
+            break
+        for discourse_data in await discourses_from_database(batch, client):
+            yield discourse_data
+
+
+async def retrieve_discourses_page(client: str, after: str = None, limit: int = 100):
+    # Return a page of discourses after the given _id, and the _id to request the next page after.
+    batch = await discourses_collection.find(discourses_after(after)).sort('_id', 1).to_list(length=limit)
+    discourses = await discourses_from_database(batch, client)
+    next_after = str(batch[-1]['_id']) if len(batch) == limit else None
+    return discourses, next_after
+
+
+async def retrieve_discourses(client: str, batch_size: int = 100):
+    discourses = [discourse_data async for discourse_data in stream_discourses(client, batch_size=batch_size)]
     return discourses
 
 
@@ -162,15 +182,86 @@ async def retrieve_discourse(id: str, client: str):
         return discourse_data
 
 
-async def add_discourse(discourse_data, include_id: bool = False):
-    discourse_data = await discourse_add_discourse_items_and_links(discourse_data, include_id)
+def discourse_for_database(discourse_data: dict, include_id: bool = False):
+    # Assign the ids on the client, so the inserted documents never need to be read back.
+    discourse_items = [discourse_item_for_database(discourse_item_data, include_id)
+                       for discourse_item_data in discourse_data['discourseItems']]
+    discourse_items_links = [discourse_items_link_for_database(discourse_items_link_data, include_id)
+                             for discourse_items_link_data in discourse_data.get('discourseItemsLinks') or []]
+    for document in discourse_items + discourse_items_links:
+        document.setdefault('_id', ObjectId())
+
+    discourse = {key: value for key, value in discourse_data.items() if key != '_id'}
+    discourse['_id'] = ObjectId(discourse_data['_id']) if include_id else ObjectId()
+    discourse['discourseItems'] = [discourse_item['_id'] for discourse_item in discourse_items]
+    discourse['discourseItemsLinks'] = [discourse_items_link['_id'] for discourse_items_link in discourse_items_links]
+    return discourse, discourse_items, discourse_items_links
+
+
+async def insert_discourses(prepared: list, session=None):
+    # Insert the items, links and discourses with one unordered insert_many per collection.
+    # Outside a transaction, if an insert fails, the documents inserted so far are deleted,
+    # so that no items or links are left without a discourse, and the error is raised.
+    batches = [
+        (bulk_discourse_items_collection,
+         [discourse_item for _, discourse_items, _ in prepared for discourse_item in discourse_items]),
+        (bulk_discourse_items_links_collection,
+         [discourse_items_link for _, _, discourse_items_links in prepared
+          for discourse_items_link in discourse_items_links]),
+        (discourses_collection, [discourse for discourse, _, _ in prepared])
+    ]
+    inserted = []
+    try:
+        for collection, documents in batches:
+            if not documents:
+                continue
+            try:
+                await collection.insert_many(documents, ordered=False, session=session)
+            except BulkWriteError as e:
+                failed = {error['index'] for error in e.details.get('writeErrors', [])}
+                inserted.append((collection, [document['_id'] for index, document in enumerate(documents)
+                                              if index not in failed]))
+                raise
+            inserted.append((collection, [document['_id'] for document in documents]))
+    except BulkWriteError:
+        if session is None:
+            for collection, ids in inserted:
+                if ids:
+                    await collection.delete_many({'_id': {'$in': ids}})
+        raise
+
+
+async def add_discourses(discourses_data: list, include_id: bool = False, transaction: bool = False,
+                         client: str = 'frontend') -> list:
+    prepared = [discourse_for_database(discourse_data, include_id) for discourse_data in discourses_data]
+    if not prepared:
+        return []
+    if transaction:
+        # The discourses are written with their items and links atomically (requires a replica set).
+        async with await database.client.start_session() as session:
+            async with session.start_transaction():
+                await insert_discourses(prepared, session)
+    else:
+        await insert_discourses(prepared)
+
+    # Build the returned discourses from the inserted documents, without reading them back.
+    results = []
+    for discourse, discourse_items, discourse_items_links in prepared:
+        discourse_items_data = [discourse_item_from_database(discourse_item, client)
+                                for discourse_item in discourse_items]
+        discourse_items_links_data = [discourse_items_link_from_database(discourse_items_link, client)
+                                      for discourse_items_link in discourse_items_links]
+        if client == 'frontend':
+            results.append({'id': str(discourse['_id']), 'data': discourse_items_data + discourse_items_links_data})
+        elif client == 'ai':
+            results.append({'id': str(discourse['_id']), 'nodes': discourse_items_data,
+                            'edges': discourse_items_links_data})
+    return results
+
 
-    if include_id:
-        discourse_data['_id'] = ObjectId(discourse_data['_id'])
-    discourse = await discourses_collection.insert_one(discourse_data)
-    new_discourse = await discourses_collection.find_one({'_id': discourse.inserted_id})
-    new_discourse_data = await discourse_from_database(new_discourse)
-    return new_discourse_data
+async def add_discourse(discourse_data, include_id: bool = False, transaction: bool = False):
+    new_discourses_data = await add_discourses([discourse_data], include_id, transaction)
+    return new_discourses_data[0]
 
 
 async def update_discourse(id: str, action: str, update_type: str, discourse_data: dict):
@@ -1,11 +1,13 @@
 import asyncio
+import argparse
 import json
+from timeit import default_timer
 from typing import List
 
 import motor.motor_asyncio
 from decouple import config
 
-from server.database.discourses_database import add_discourse
+from server.database.discourses_database import add_discourses
 
 MONGO_INITDB_ROOT_USERNAME = config('MONGO_INITDB_ROOT_USERNAME')
 MONGO_INITDB_ROOT_PASSWORD = config('MONGO_INITDB_ROOT_PASSWORD')
@@ -18,20 +20,41 @@ database = client.inPOINT
 discourses_collection = database.get_collection('discourses')
 
 
-async def _add_discourses(discourses: List[dict]):
-    for discourse in discourses:
-        print(f"Add seed discourse: {discourse['_id']}")
-        await add_discourse(discourse, include_id=True)
+def _count_documents(discourses: List[dict]) -> int:
+    return sum(1 + len(discourse['discourseItems']) + len(discourse.get('discourseItemsLinks') or [])
+               for discourse in discourses)
 
 
-async def main(seed_json_filepath):
+async def _add_discourses(discourses: List[dict], batch_size: int, concurrency: int, transaction: bool):
+    # Insert the discourses in bulk batches, with a bounded number of batches in flight.
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def add_batch(batch: List[dict]):
+        async with semaphore:
+            await add_discourses(batch, include_id=True, transaction=transaction)
+            print(f"Added {len(batch)} seed discourses: {', '.join(discourse['_id'] for discourse in batch)}")
+
+    await asyncio.gather(*[add_batch(discourses[start:start + batch_size])
+                           for start in range(0, len(discourses), batch_size)])
+
+
+async def main(seed_json_filepath, batch_size: int = 100, concurrency: int = 4, transaction: bool = False):
     with open(seed_json_filepath) as f:
         data = json.load(f)
-    await _add_discourses(data['discourses'])
+    documents = _count_documents(data['discourses'])
+    start = default_timer()
+    await _add_discourses(data['discourses'], batch_size, concurrency, transaction)
+    seconds = default_timer() - start
+    print(f'Inserted {documents} documents in {seconds:.3f} secs ({documents / seconds:.0f} docs/sec)')
 
 
 if __name__ == '__main__':
-    SEED_JSON_FILEPATH = 'server/database/seed/data.json'
+    parser = argparse.ArgumentParser(description='Seed the discourses database.')
+    parser.add_argument('--file', default='server/database/seed/data.json')
+    parser.add_argument('--batch-size', type=int, default=100, help='Discourses per bulk insert.')
+    parser.add_argument('--concurrency', type=int, default=4, help='Bulk inserts in flight.')
+    parser.add_argument('--transaction', action='store_true', help='Insert each batch in a transaction.')
+    args = parser.parse_args()
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(main(SEED_JSON_FILEPATH))
-    loop.close()
\ No newline at end of file
+    loop.run_until_complete(main(args.file, args.batch_size, args.concurrency, args.transaction))
+    loop.close()
@@ -0,0 +1,254 @@
+import os
+import math
+import time
+import uuid
+import socket
+import logging
+import datetime
+import threading
+from croniter import croniter
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+
+
+class FixedRateTrigger:
+    """
+    Trigger which fires every interval seconds, on a fixed grid
+    anchored at its start time, so the duration of the runs
+    never shifts the later runs. Missed runs are skipped.
+    """
+    def __init__(self, interval, start = None):
+        self.interval = interval
+        self.start = time.time() if start is None else start
+
+    def next_run(self, now):
+        if now < self.start:
+            return self.start
+        return self.start + (math.floor((now - self.start) / self.interval) + 1) * self.interval
+
+
+class CronTrigger:
+    """
+    Trigger which fires according to a cron expression, e.g. '0 * * * *'.
+    """
+    def __init__(self, expression):
+        self.expression = expression
+
+    def next_run(self, now):
+        return croniter(self.expression, datetime.datetime.fromtimestamp(now)).get_next(float)
+
+
+class MongoLock:
+    """
+    Single-flight lock, stored as a document per job, so that at most
+    one run of the job executes across all processes and containers.
+    The lock is acquired atomically, and is leased for a limited time,
+    which the owner renews while running, so a crashed run never blocks.
+    """
+    def __init__(self, collection, name, lease = 600):
+        self.collection, self.name, self.lease = collection, name, lease
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}'
+
+    def acquire(self):
+        now = datetime.datetime.utcnow()
+        try:
+            # Match the lock only if it is free or expired; otherwise
+            # the upsert collides with the existing lock document.
+            self.collection.find_one_and_update(
+                {'_id': self.name, '$or': [{'owner': None}, {'expires': {'$lt': now}}]},
+                {'$set': {
+                    'owner': self.owner,
+                    'acquired': now,
+                    'expires': now + datetime.timedelta(seconds = self.lease)
+                }},
+                upsert = True,
+                return_document = ReturnDocument.AFTER
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def renew(self):
+        expires = datetime.datetime.utcnow() + datetime.timedelta(seconds = self.lease)
+        result = self.collection.update_one(
+            {'_id': self.name, 'owner': self.owner}, {'$set': {'expires': expires}}
+        )
+        return result.modified_count == 1
+
+    def release(self):
+        self.collection.update_one(
+            {'_id': self.name, 'owner': self.owner},
+            {'$set': {'owner': None, 'expires': datetime.datetime.utcnow()}}
+        )
+
+
+class JobRunner:
+    """
+    Job runner which sleeps until the next run of its trigger,
+    or until a run is requested on demand, instead of polling.
+    The job is called with an event, which is set when it must stop.
+    Each run holds the single-flight lock of the job,
+    and its duration & status are stored in the run history.
+    """
+    def __init__(self, name, job, trigger, lock, history):
+        self.name, self.job, self.trigger, self.lock, self.history = name, job, trigger, lock, history
+        self.__wake = threading.Event()
+        self.__reasons, self.__reasons_lock = [], threading.Lock()
+        self.__stopped = False
+
+    def request_run(self, reason = 'on-demand'):
+        """
+        Method which requests a run as soon as possible.
+        Requests which arrive during a run are merged into the next run.
+        """
+        with self.__reasons_lock:
+            self.__reasons.append(reason)
+        self.__wake.set()
+
+    def stop(self):
+        """
+        Method which stops the runner after the current run, if any.
+        """
+        self.__stopped = True
+        self.__wake.set()
+
+    def run_forever(self):
+        next_run = self.trigger.next_run(time.time())
+        while not self.__stopped:
+            self.__wake.wait(timeout = max(0, next_run - time.time()))
+            self.__wake.clear()
+            if self.__stopped:
+                break
+
+            with self.__reasons_lock:
+                reasons, self.__reasons = self.__reasons, []
+            if time.time() >= next_run:
+                reasons.append('schedule')
+                next_run = self.trigger.next_run(time.time())
+            if reasons:
+                self.run(', '.join(sorted(set(reasons))))
+
+            # Skip the scheduled runs which were missed during this run.
+            if next_run <= time.time():
+                next_run = self.trigger.next_run(time.time())
+
+    def run(self, reason):
+        """
+        Method which runs the job once, if no other run holds its lock,
+        and stores the run in the history. The job is given an event,
+        which is set if the lease of the lock is lost, so that it stops,
+        since another runner may then acquire the lock. MongoDB errors
+        are logged, so they never stop the runner.
+        """
+        try:
+            if not self.lock.acquire():
+                logging.warning(f'{self.name}: Skipped the {reason} run, another run is in progress.')
+                return
+        except PyMongoError as e:
+            logging.error(f'{self.name}: Skipped the {reason} run, its lock could not be acquired: {e!r}')
+            return
+
+        # Renew the lease of the lock, while the job runs. A failed renewal
+        # is retried, until the lease expires; a refused one means it is lost.
+        finished, lease_lost = threading.Event(), threading.Event()
+        def heartbeat():
+            renewed = time.monotonic()
+            while not finished.wait(self.lock.lease / 3):
+                try:
+                    if self.lock.renew():
+                        renewed = time.monotonic()
+                        continue
+                except PyMongoError as e:
+                    logging.warning(f'{self.name}: Could not renew the lease of the lock: {e!r}')
+                    if time.monotonic() - renewed < self.lock.lease:
+                        continue
+                logging.error(f'{self.name}: Lost the lease of the lock, stopping the {reason} run.')
+                lease_lost.set()
+                return
+        threading.Thread(target = heartbeat, daemon = True).start()
+
+        started, start = datetime.datetime.utcnow(), time.perf_counter()
+        status, error = 'succeeded', None
+        try:
+            logging.info(f'{self.name}: Started the {reason} run.')
+            self.job(lease_lost)
+        except Exception as e:
+            logging.exception(e)
+            status, error = 'failed', repr(e)
+        finally:
+            finished.set()
+        if lease_lost.is_set():
+            status = 'cancelled'
+
+        duration = time.perf_counter() - start
+        logging.info(f'{self.name}: The {reason} run {status} in {duration:.1f} secs.')
+        try:
+            self.lock.release()
+            self.history.insert_one({
+                'job': self.name,
+                'reason': reason,
+                'owner': self.lock.owner,
+                'started': started,
+                'duration': duration,
+                'status': status,
+                'error': error
+            })
+        except PyMongoError as e:
+            logging.error(f'{self.name}: Could not release the lock or store the {reason} run: {e!r}')
+
+
+def trigger_document(reason = 'on-demand'):
+    """
+    Function which returns the document of a run request,
+    as stored in the triggers collection.
+    """
+    return {'reason': reason, 'date': datetime.datetime.utcnow(), 'handled': False}
+
+
+def request_run(collection, reason = 'on-demand'):
+    """
+    Function which requests a run of the job runners,
+    which watch the triggers collection.
+    """
+    collection.insert_one(trigger_document(reason))
+
+
+def watch_triggers(collection, runner, poll_interval = 10, max_delay = 60):
+    """
+    Function which forwards the run requests of the triggers collection
+    to the runner. A change stream signals new requests at once;
+    standalone MongoDB servers have no change streams, so it falls back
+    to polling. Each request is claimed atomically, so it runs only once.
+    If MongoDB becomes unreachable, it reconnects with exponential backoff,
+    so on-demand runs resume without restarting the scheduler.
+    """
+    def claim_requests():
+        while True:
+            request = collection.find_one_and_update(
+                {'handled': False}, {'$set': {'handled': True}}
+            )
+            if request is None:
+                return
+            runner.request_run(request.get('reason', 'on-demand'))
+
+    polling, delay = False, 1
+    while True:
+        try:
+            if not polling:
+                try:
+                    with collection.watch([{'$match': {'operationType': 'insert'}}]) as stream:
+                        claim_requests()
+                        delay = 1
+                        for _ in stream:
+                            claim_requests()
+                except OperationFailure:
+                    logging.info('The triggers collection has no change streams, polling it instead.')
+                    polling = True
+            while polling:
+                claim_requests()
+                delay = 1
+                time.sleep(poll_interval)
+        except PyMongoError as e:
+            logging.warning(f'Watching the triggers collection failed, retrying in {delay} secs: {e!r}')
+            time.sleep(delay)
+            delay = min(2 * delay, max_delay)
@@ -1,12 +1,17 @@
-from typing import Union
+import orjson
+from typing import List, Union, Optional
 from pydantic import Field
-from fastapi import APIRouter, Body, status
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError, OperationFailure
+from fastapi import APIRouter, Body, Query, status
 from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from server.models.discourses import (Discourse, UpdateDiscourseAddDiscourseItem, UpdateDiscourseAddDiscourseItemsLink,
                                       UpdateDiscourseDeleteDiscourseItemOrLink, Action, UpdateType)
 from server.models.responses import ResponseModel, ErrorResponseModel
-from server.database.discourses_database import (add_discourse, delete_discourse, retrieve_discourse,
-                                                 retrieve_discourses, update_discourse, retrieve_discourse_ids)
+from server.database.discourses_database import (add_discourse, add_discourses, delete_discourse,
+                                                 retrieve_discourse, retrieve_discourses, update_discourse,
+                                                 retrieve_discourse_ids, retrieve_discourses_page, stream_discourses)
 
 router = APIRouter()
 
@@ -21,22 +26,59 @@ async def add_discourse_data(discourseItem: Discourse = Body(...)):
                                               f'The discourse couldn\'t be added')
 
 
-@router.get('/frontend', response_description='Discourses retrieved for frontend')
-async def get_discourses_frontend():
-    client = 'frontend'
+@router.post('/bulk', response_description='Discourses added into the database')
+async def add_discourses_data(discourses: List[Discourse] = Body(...), transaction: bool = False):
+    discourses_data = jsonable_encoder(discourses)
+    try:
+        new_discourses = await add_discourses(discourses_data, transaction=transaction)
+    except BulkWriteError as e:
+        # Either the transaction was aborted, or the inserted documents were deleted.
+        return ErrorResponseModel.return_response('An error occurred', status.HTTP_403_FORBIDDEN,
+                                                  f'No discourse was added, since '
+                                                  f'{len(e.details.get("writeErrors", []))} of their documents '
+                                                  f'couldn\'t be inserted')
+    except OperationFailure as e:
+        # Standalone servers reject transactions with an IllegalOperation error.
+        if not transaction or e.code != 20:
+            raise
+        return ErrorResponseModel.return_response('An error occurred', status.HTTP_400_BAD_REQUEST,
+                                                  'Transactions require MongoDB to run as a replica set')
+    return ResponseModel.return_response(new_discourses)
+
+
+async def get_discourses(client: str, after: Optional[str], limit: Optional[int], stream: bool):
+    if after is not None and not ObjectId.is_valid(after):
+        return ErrorResponseModel.return_response('An error occurred', status.HTTP_400_BAD_REQUEST,
+                                                  'The after cursor must be a discourse id')
+
+    # Stream the discourses as NDJSON, one discourse per line, as soon as each batch is assembled.
+    if stream:
+        async def lines():
+            async for discourse in stream_discourses(client, after):
+                yield orjson.dumps(discourse) + b'\n'
+        return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+    # Return a page of discourses, with the cursor of the next page.
+    if after is not None or limit is not None:
+        discourses, next_after = await retrieve_discourses_page(client, after, limit or 100)
+        return ResponseModel.return_response({'discourses': discourses, 'next': next_after})
+
     discourses = await retrieve_discourses(client)
     if discourses:
         return ResponseModel.return_response(discourses)
     return ResponseModel.return_response({'message': 'Empty List'})
 
 
-@router.get('/ai', response_description='Discourses retrieved for frontend')
-async def get_discourses_frontend():
-    client = 'ai'
-    discourses = await retrieve_discourses(client)
-    if discourses:
-        return ResponseModel.return_response(discourses)
-    return ResponseModel.return_response({'message': 'Empty List'})
+@router.get('/frontend', response_description='Discourses retrieved for frontend')
+async def get_discourses_frontend(after: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=1000),
+                                  stream: bool = False):
+    return await get_discourses('frontend', after, limit, stream)
+
+
+@router.get('/ai', response_description='Discourses retrieved for ai')
+async def get_discourses_ai(after: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=1000),
+                            stream: bool = False):
+    return await get_discourses('ai', after, limit, stream)
 
 
 @router.get('/ids', response_description='Discourses retrieved')